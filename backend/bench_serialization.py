@@ -0,0 +1,49 @@
+"""
+Micro-benchmark: per-request serialization cost of a classroom list response.
+
+  before: model_dump() -> ResponseModel validation -> jsonable_encoder -> json.dumps
+  after:  model_dump() -> orjson.dumps (wire.respond / wire.dumps)
+
+Usage: python bench_serialization.py [n_classrooms] [iterations]
+"""
+import json
+import sys
+import timeit
+from datetime import datetime
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+import models, schemas, wire
+
+
+def make_classrooms(n: int):
+    return [
+        models.Classroom(
+            _id=f"{i:024x}", classId=f"C{i}", className=f"Room {i}", deviceId=f"dev-{i}",
+            capacity=100, occupancy=i % 100, latestImage="https://example.com/x.jpg",
+            created_at=datetime.now(), updated_at=datetime.now(),
+        )
+        for i in range(n)
+    ]
+
+
+def before(docs):
+    body = {"success": True, "message": "ok", "data": {"classrooms": [d.model_dump() for d in docs]}}
+    validated = schemas.ResponseModel(**body).model_dump()
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def after(docs):
+    body = {"success": True, "message": "ok", "data": {"classrooms": [wire.classroom_to_wire(d) for d in docs]}}
+    return orjson.dumps(body)
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    docs = make_classrooms(n)
+
+    for name, fn in (("before", before), ("after", after)):
+        total = timeit.timeit(lambda: fn(docs), number=iterations)
+        print(f"{name:>6}: {total / iterations * 1e6:9.1f} us/request ({n} classrooms)")
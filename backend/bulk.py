@@ -0,0 +1,189 @@
+"""
+Streaming CSV / NDJSON helpers for bulk classroom import and export.
+
+Import bodies are consumed chunk by chunk and parsed record by record (a
+CSV record spans several lines when a quoted field contains newlines), so
+an upload of thousands of rows is never held in memory as a whole; rows are
+validated against `schemas.CreateClassroomRequest` and handed to the
+database in batches. Undecodable or malformed records are reported per
+row. Export walks a Mongo cursor and yields one encoded line per document.
+"""
+import csv
+import io
+from typing import AsyncIterator, Iterable, Optional, Tuple
+
+import orjson
+from pydantic import ValidationError
+
+import database, models, schemas, wire
+
+
+CSV_FIELDS = [
+    "classId", "className", "deviceId", "capacity", "occupancy", "latestImage", "inferenceMode",
+    "captureMinS", "captureMaxS",
+]
+BATCH_SIZE = 500
+# A quoted CSV field still open after this many characters is treated as unterminated
+MAX_RECORD_CHARS = 64 * 1024
+
+
+def detect_format(content_type: Optional[str]) -> Optional[str]:
+    media = (content_type or "").split(";")[0].strip().lower()
+    if media in ("text/csv", "application/csv"):
+        return "csv"
+    if media in ("application/x-ndjson", "application/ndjson", "application/jsonl"):
+        return "ndjson"
+    return None
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split a byte stream into raw lines (line endings removed) without buffering the whole body."""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r")
+    if pending:
+        yield pending.rstrip(b"\r")
+
+
+async def iter_records(lines: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Tuple[Optional[str], Optional[str]]]:
+    """
+    Yield (record, None) for each decoded record, or (None, error) for one that
+    is not valid UTF-8 / has an unterminated quoted field. Blank lines outside
+    a record are skipped.
+    """
+    record = None
+    async for line in lines:
+        try:
+            text = line.decode("utf-8")
+        except UnicodeDecodeError as e:
+            record = None
+            yield None, f"invalid UTF-8: {e}"
+            continue
+
+        if record is not None:
+            record += "\n" + text
+        elif text.strip():
+            record = text
+        else:
+            continue
+
+        if fmt == "csv":
+            try:
+                next(csv.reader([record], strict=True))
+            except csv.Error as e:
+                if "unexpected end of data" in str(e) and len(record) < MAX_RECORD_CHARS:
+                    continue  # quoted field carries on on the next line
+                if "unexpected end of data" in str(e):
+                    e = "unterminated quoted field"
+                record = None
+                yield None, f"invalid CSV: {e}"
+                continue
+        yield record, None
+        record = None
+
+    if record is not None:
+        yield None, "invalid CSV: unterminated quoted field"
+
+
+async def iter_rows(
+    lines: AsyncIterator[bytes], fmt: str
+) -> AsyncIterator[Tuple[int, Optional[schemas.CreateClassroomRequest], Optional[str]]]:
+    """Yield (row number, parsed row or None, error or None) for each data record."""
+    header = None
+    row_no = 0
+    async for record, error in iter_records(lines, fmt):
+        if error:
+            row_no += 1
+            yield row_no, None, error
+            continue
+
+        if fmt == "csv":
+            values = next(csv.reader([record], strict=True))
+            if header is None:
+                header = [h.strip().lstrip("\ufeff") for h in values]
+                continue
+            raw = {k: (v if v != "" else None) for k, v in zip(header, values)}
+            raw = {k: v for k, v in raw.items() if v is not None}
+        else:
+            try:
+                raw = orjson.loads(record)
+            except orjson.JSONDecodeError as e:
+                row_no += 1
+                yield row_no, None, f"invalid JSON: {e}"
+                continue
+
+        row_no += 1
+        try:
+            yield row_no, schemas.CreateClassroomRequest(**raw), None
+        except (ValidationError, TypeError) as e:
+            yield row_no, None, str(e)
+
+
+async def import_rows(lines: AsyncIterator[bytes], fmt: str, ordered: bool = False) -> dict:
+    """
+    Validate and upsert rows in BATCH_SIZE bulk writes.
+
+    With `ordered`, processing stops at the first invalid or failed row (rows
+    before it are still applied); otherwise every row is attempted and all
+    failures are reported as {"row": <1-based row number>, "error": ...}.
+    """
+    summary = {"rows": 0, "inserted": 0, "updated": 0, "matched": 0, "errors": []}
+    batch, batch_rows = [], []
+
+    async def flush() -> bool:
+        result = await database.bulk_upsert_classrooms(batch, ordered=ordered)
+        for key in ("inserted", "updated", "matched"):
+            summary[key] += result[key]
+        summary["errors"].extend({"row": batch_rows[e["index"]], "error": e["error"]} for e in result["errors"])
+        batch.clear()
+        batch_rows.clear()
+        return not result["errors"]
+
+    async for row_no, row, error in iter_rows(lines, fmt):
+        summary["rows"] += 1
+        if error:
+            summary["errors"].append({"row": row_no, "error": error})
+            if ordered:
+                break
+            continue
+
+        batch.append(row.model_dump(exclude_unset=True))
+        batch_rows.append(row_no)
+        if len(batch) >= BATCH_SIZE and not await flush() and ordered:
+            break
+
+    if batch:
+        await flush()
+    return summary
+
+
+async def export_ndjson(classrooms: AsyncIterator[models.Classroom]) -> AsyncIterator[bytes]:
+    lines = []
+    async for classroom in classrooms:
+        lines.append(orjson.dumps(wire.classroom_to_wire(classroom)))
+        if len(lines) >= BATCH_SIZE:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+async def export_csv(classrooms: AsyncIterator[models.Classroom]) -> AsyncIterator[str]:
+    yield _encode_csv([CSV_FIELDS])
+    rows = []
+    async for classroom in classrooms:
+        rows.append(["" if getattr(classroom, f) is None else getattr(classroom, f) for f in CSV_FIELDS])
+        if len(rows) >= BATCH_SIZE:
+            yield _encode_csv(rows)
+            rows = []
+    if rows:
+        yield _encode_csv(rows)
+
+
+def _encode_csv(rows: Iterable[list]) -> str:
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    return buf.getvalue()
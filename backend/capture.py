@@ -0,0 +1,69 @@
+"""
+Server-recommended capture interval for classroom cameras.
+
+After every frame the device is told how long to wait before the next one.
+The recommendation starts from the time of day (short during teaching
+hours, long at night and at weekends) or from a matching per-classroom
+schedule window, is shortened when recent occupancy readings are changing
+and lengthened when the room is steadily empty, stretched further while
+the inference servers are degraded, and finally clamped to the classroom's
+own min/max bounds.
+"""
+from collections import deque
+from datetime import datetime
+from statistics import pvariance
+from typing import Deque, Dict, Optional
+from zoneinfo import ZoneInfo
+
+import models
+
+
+LOCAL_TZ = ZoneInfo("Africa/Lagos")
+TEACHING_DAYS = range(0, 5)        # Monday..Friday
+TEACHING_HOURS = (7, 19)           # 07:00 - 19:00
+HISTORY = 6                        # occupancy readings kept per classroom
+
+
+class CapturePlanner:
+    def __init__(self):
+        self.history: Dict[str, Deque[int]] = {}
+
+    def record(self, classId: str, occupancy: int):
+        self.history.setdefault(classId, deque(maxlen=HISTORY)).append(occupancy)
+
+    def forget(self, classId: str):
+        self.history.pop(classId, None)
+
+    def _scheduled(self, classroom: models.Classroom, now: datetime) -> Optional[int]:
+        hhmm = now.strftime("%H:%M")
+        for window in classroom.captureSchedule or []:
+            if window.start < window.end:
+                inside, start_day = window.start <= hhmm < window.end, now.weekday()
+            elif hhmm >= window.start:              # crosses midnight, evening part
+                inside, start_day = True, now.weekday()
+            else:                                   # crosses midnight, early-morning part
+                inside, start_day = hhmm < window.end, (now.weekday() - 1) % 7
+            if inside and (window.days is None or start_day in window.days):
+                return window.intervalS
+        return None
+
+    def next_interval(self, classroom: models.Classroom, load_level: int = 0, now: datetime = None) -> int:
+        """Seconds the device should wait before capturing the next frame."""
+        now = now or datetime.now(LOCAL_TZ)
+        lo, hi = classroom.captureMinS, classroom.captureMaxS
+
+        interval = self._scheduled(classroom, now)
+        if interval is None:
+            teaching = now.weekday() in TEACHING_DAYS and TEACHING_HOURS[0] <= now.hour < TEACHING_HOURS[1]
+            interval = lo * 2 if teaching else hi
+
+            readings = self.history.get(classroom.classId)
+            if readings and len(readings) >= 2:
+                if pvariance(readings) > max(1.0, 0.01 * classroom.capacity):
+                    interval = lo                   # people are arriving / leaving
+                elif max(readings) == 0:
+                    interval = interval * 2         # steadily empty
+
+        # Give overloaded inference servers room to recover
+        interval = interval * (1 + load_level)
+        return int(min(hi, max(lo, interval)))
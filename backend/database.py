@@ -1,15 +1,41 @@
+import asyncio
+import logging
+import time
 from datetime import datetime
 from bson import ObjectId
 from fastapi import HTTPException, status
 from motor.motor_asyncio import AsyncIOMotorClient
-from typing import Union, List, Dict
+from pymongo import UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError, ConnectionFailure, NetworkTimeout, ServerSelectionTimeoutError
+from typing import AsyncIterator, Awaitable, Callable, Union, List, Dict, Tuple
 
-import env, models
+import env, models, schemas
 
 
-client = AsyncIOMotorClient(env.MONGO_URI, tls=True, tlsAllowInvalidCertificates=True)
+logger = logging.getLogger("smart-classroom.db")
+
+client = AsyncIOMotorClient(
+    env.MONGO_URI,
+    tls=True,
+    tlsAllowInvalidCertificates=True,
+    maxPoolSize=env.MONGO_MAX_POOL_SIZE,
+    minPoolSize=env.MONGO_MIN_POOL_SIZE,
+    serverSelectionTimeoutMS=env.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    connectTimeoutMS=env.MONGO_CONNECT_TIMEOUT_MS,
+    socketTimeoutMS=env.MONGO_SOCKET_TIMEOUT_MS,
+)
 db = client["smartclassDB"]
 
+# Errors that mean "the cluster is unreachable", as opposed to a bad query
+CONNECTION_ERRORS = (ConnectionFailure, ServerSelectionTimeoutError, NetworkTimeout, AutoReconnect)
+
+
+def _retryable(e: Exception) -> bool:
+    # A server-selection timeout has already waited serverSelectionTimeoutMS (and
+    # pymongo's retryReads has had its go), so it goes straight to the breaker.
+    # It subclasses AutoReconnect, hence the explicit exclusion.
+    return isinstance(e, (AutoReconnect, NetworkTimeout)) and not isinstance(e, ServerSelectionTimeoutError)
+
 
 def throw_mongo_error() -> None:
     raise HTTPException(
@@ -18,54 +44,288 @@ def throw_mongo_error() -> None:
     )
 
 
+def throw_unavailable(retry_after: int) -> None:
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Database temporarily unavailable. Try again shortly.",
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+# -------------------------------------------------------
+# CIRCUIT BREAKER + OPERATION METRICS
+# -------------------------------------------------------
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive connection failures and rejects calls
+    for `reset_s` seconds; then lets one trial call through (half-open), which
+    closes the circuit on success or re-opens it on failure.
+    """
+
+    def __init__(self, threshold: int, reset_s: float):
+        self.threshold = threshold
+        self.reset_s = reset_s
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_s else "open"
+
+    def retry_after(self) -> int:
+        if self.opened_at is None:
+            return 0
+        return max(1, int(self.reset_s - (time.monotonic() - self.opened_at)) + 1)
+
+    def check(self) -> bool:
+        """Reject the call while open; returns True if the caller is the half-open trial."""
+        state = self.state
+        if state == "open" or (state == "half-open" and self.trial_running):
+            throw_unavailable(self.retry_after() or int(self.reset_s))
+        if state == "half-open":
+            self.trial_running = True
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def failure(self):
+        self.failures += 1
+        self.trial_running = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            if self.opened_at is None or self.state == "half-open":
+                logger.warning("MongoDB circuit opened after %d failures", self.failures)
+            self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker(threshold=env.MONGO_BREAKER_THRESHOLD, reset_s=env.MONGO_BREAKER_RESET_S)
+
+# op name -> {"calls", "errors", "total_ms"}
+op_stats: Dict[str, Dict[str, float]] = {}
+
+
+def _record(op: str, started: float, error: bool):
+    stats = op_stats.setdefault(op, {"calls": 0, "errors": 0, "total_ms": 0.0})
+    stats["calls"] += 1
+    stats["errors"] += int(error)
+    stats["total_ms"] += (time.monotonic() - started) * 1000
+
+
+def metrics_lines() -> List[str]:
+    """Prometheus text lines for the database layer."""
+    lines = [
+        "# TYPE mongo_circuit_open gauge",
+        f"mongo_circuit_open {int(breaker.state != 'closed')}",
+    ]
+    for metric, key in (("mongo_op_calls_total", "calls"), ("mongo_op_errors_total", "errors"),
+                        ("mongo_op_latency_ms_total", "total_ms")):
+        lines.append(f"# TYPE {metric} counter")
+        for op, s in sorted(op_stats.items()):
+            lines.append(f'{metric}{{op="{op}"}} {s[key]:g}')
+    return lines
+
+
+async def _run(op: str, call: Callable[[], Awaitable], idempotent: bool = False):
+    """
+    Run one Mongo operation through the breaker, retrying idempotent reads a
+    bounded number of times on transient network errors.
+    """
+    is_trial = breaker.check()
+    attempts = 1 + (env.MONGO_READ_RETRIES if idempotent else 0)
+    try:
+        for attempt in range(attempts):
+            started = time.monotonic()
+            try:
+                result = await call()
+            except CONNECTION_ERRORS as e:
+                _record(op, started, error=True)
+                logger.warning("%s failed (attempt %d/%d): %s", op, attempt + 1, attempts, e)
+                if attempt + 1 < attempts and _retryable(e) and breaker.state == "closed":
+                    await asyncio.sleep(0.1 * 2 ** attempt)
+                    continue
+                breaker.failure()
+                throw_unavailable(breaker.retry_after() or 1)
+            except BulkWriteError:
+                _record(op, started, error=True)
+                breaker.success()
+                raise
+            except Exception as e:
+                _record(op, started, error=True)
+                breaker.success()
+                logger.exception("%s failed: %s", op, e)
+                throw_mongo_error()
+            else:
+                _record(op, started, error=False)
+                breaker.success()
+                return result
+    finally:
+        # Cancelled (or otherwise interrupted) before success()/failure(): free the trial slot
+        if is_trial and breaker.trial_running:
+            breaker.trial_running = False
+
+
 # CRUD for classrooms
 async def add_classroom(classroom: models.Classroom) -> str:
-    try:
-        now = datetime.now()
-        payload = classroom.model_dump()
-        payload.update({"created_at": now, "updated_at": now})
-        result = await db.classrooms.insert_one(payload)
-        return str(result.inserted_id)
-    except Exception as e:
-        print(e)
-        throw_mongo_error()
+    now = datetime.now()
+    payload = classroom.model_dump()
+    payload.update({"created_at": now, "updated_at": now})
+    result = await _run("insert_classroom", lambda: db.classrooms.insert_one(payload))
+    return str(result.inserted_id)
 
 
+# Documents are parsed inside the _run call, so a malformed one maps to 501 like any other query error
 async def get_classroom_by_classId(classId: str) -> Union[models.Classroom, None]:
-    try:
+    async def call():
         doc = await db.classrooms.find_one({"classId": classId})
         return models.Classroom(**doc) if doc else None
-    except Exception as e:
-        print(e)
-        throw_mongo_error()
+
+    return await _run("get_classroom", call, idempotent=True)
 
 
 async def list_classrooms() -> List[models.Classroom]:
-    try:
-        cursor = db.classrooms.find({})
-        docs = await cursor.to_list(length=1000)
-        return [models.Classroom(**d) for d in docs]
-    except Exception as e:
-        print(e)
-        throw_mongo_error()
+    async def call():
+        return [models.Classroom(**d) for d in await db.classrooms.find({}).to_list(length=1000)]
+
+    return await _run("list_classrooms", call, idempotent=True)
+
+
+async def list_occupancy() -> List[Tuple[str, int, int]]:
+    """(classId, occupancy, capacity) for every classroom, for seeding the campus stats."""
+    projection = {"_id": 0, "classId": 1, "occupancy": 1, "capacity": 1}
+    docs = await _run("list_occupancy", lambda: db.classrooms.find({}, projection).to_list(length=None), idempotent=True)
+    return [(d["classId"], d.get("occupancy", 0), d.get("capacity", 0)) for d in docs]
 
 
 async def update_classroom_by_classId(classId: str, payload: Dict) -> Union[models.Classroom, None]:
-    try:
-        payload.update({"updated_at": datetime.now()})
+    payload.update({"updated_at": datetime.now()})
+
+    async def call():
         result = await db.classrooms.find_one_and_update(
-            {"classId": classId}, {"$set": payload}, return_document=True
+            {"classId": classId}, {"$set": payload, "$inc": {"version": 1}}, return_document=True
         )
         return models.Classroom(**result) if result else None
-    except Exception as e:
-        print(e)
-        throw_mongo_error()
+
+    return await _run("update_classroom", call)
 
 
 async def delete_classroom_by_classId(classId: str) -> bool:
+    res = await _run("delete_classroom", lambda: db.classrooms.delete_one({"classId": classId}))
+    return res.deleted_count == 1
+
+
+async def _stored_capture_bounds(classIds: List[str]) -> Dict[str, Tuple[int, int]]:
+    fields = models.Classroom.model_fields
+    default = (fields["captureMinS"].default, fields["captureMaxS"].default)
+
+    async def call():
+        docs = await db.classrooms.find(
+            {"classId": {"$in": classIds}}, {"_id": 0, "classId": 1, "captureMinS": 1, "captureMaxS": 1}
+        ).to_list(length=None)
+        return {d["classId"]: (d.get("captureMinS", default[0]), d.get("captureMaxS", default[1])) for d in docs}
+
+    stored = await _run("get_capture_bounds", call, idempotent=True)
+    return {classId: stored.get(classId, default) for classId in classIds}
+
+
+async def bulk_upsert_classrooms(rows: List[Dict], ordered: bool = False) -> Dict:
+    """
+    Upsert classrooms keyed by classId in one bulk_write.
+
+    Fields present in a row are $set; defaults for missing fields are only
+    applied when the classroom is inserted. A row that sets only one capture
+    bound is checked against the stored other bound first, as PUT does.
+    Returns counts plus per-row errors as
+    {"index": <position in rows>, "error": <message>}.
+    """
+    now = datetime.now()
+    defaults = models.Classroom.model_fields
+    partial = [row["classId"] for row in rows if ("captureMinS" in row) != ("captureMaxS" in row)]
+    stored_bounds = await _stored_capture_bounds(partial) if partial else {}
+
+    errors, ops, op_rows = [], [], []
+    for index, row in enumerate(rows):
+        if row["classId"] in stored_bounds and (("captureMinS" in row) != ("captureMaxS" in row)):
+            lo, hi = stored_bounds[row["classId"]]
+            try:
+                schemas.check_capture_bounds(row.get("captureMinS", lo), row.get("captureMaxS", hi))
+            except ValueError as e:
+                errors.append({"index": index, "error": str(e)})
+                if ordered:
+                    break
+                continue
+
+        to_set = dict(row, updated_at=now)
+        on_insert = {"created_at": now}
+        for name, field in defaults.items():
+            if name not in to_set and not field.is_required() and name not in ("id", "version", "created_at", "updated_at"):
+                on_insert[name] = field.default
+        update = {"$set": to_set, "$setOnInsert": on_insert, "$inc": {"version": 1}}
+        ops.append(UpdateOne({"classId": row["classId"]}, update, upsert=True))
+        op_rows.append(index)
+
+    details = {}
+    if ops:
+        try:
+            res = await _run("bulk_upsert_classrooms", lambda: db.classrooms.bulk_write(ops, ordered=ordered))
+            details = res.bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            errors += [{"index": op_rows[err["index"]], "error": err.get("errmsg", "write error")}
+                       for err in details.get("writeErrors", [])]
+        errors.sort(key=lambda err: err["index"])
+
+    return {
+        "inserted": details.get("nUpserted", 0),
+        "updated": details.get("nModified", 0),
+        "matched": details.get("nMatched", 0),
+        "errors": errors,
+    }
+
+
+async def iter_classrooms(batch_size: int = 500) -> AsyncIterator[models.Classroom]:
+    """
+    Open a cursor over every classroom and return an iterator that streams
+    them without materialising the collection.
+
+    The first batch is fetched (through the breaker, with retries) before
+    this returns, so an unreachable database surfaces as a 503/501 before a
+    streaming response has sent its headers.
+    """
+    cursor = None
+
+    async def first_batch():
+        nonlocal cursor
+        cursor = db.classrooms.find({}).batch_size(batch_size)
+        return [models.Classroom(**d) for d in await cursor.to_list(length=batch_size)]
+
+    first = await _run("iter_classrooms", first_batch, idempotent=True)
+    return _stream_classrooms(cursor, first)
+
+
+async def _stream_classrooms(cursor, first: List[models.Classroom]) -> AsyncIterator[models.Classroom]:
+    # The rest of the cursor can outlive many breaker transitions (and may be
+    # abandoned by a disconnecting client), so it never claims or resolves the
+    # half-open trial: connection errors count as failures, success is not reported.
+    for classroom in first:
+        yield classroom
+    started = time.monotonic()
     try:
-        res = await db.classrooms.delete_one({"classId": classId})
-        return res.deleted_count == 1
+        async for doc in cursor:
+            yield models.Classroom(**doc)
+    except CONNECTION_ERRORS as e:
+        _record("iter_classrooms", started, error=True)
+        breaker.failure()
+        logger.warning("iter_classrooms failed: %s", e)
+        throw_unavailable(breaker.retry_after() or 1)
     except Exception as e:
-        print(e)
+        _record("iter_classrooms", started, error=True)
+        logger.exception("iter_classrooms failed: %s", e)
         throw_mongo_error()
+    else:
+        _record("iter_classrooms", started, error=False)
@@ -2,22 +2,69 @@ import os
 from dotenv import load_dotenv
 
 
+load_dotenv()
+
+# Which part of the backend this process serves:
+#   api       - CRUD + WebSocket only (no inference stack is ever imported)
+#   inference - image upload / YOLO routes only
+#   all       - both (default)
+APP_ROLES = ("api", "inference", "all")
+APP_ROLE = os.getenv("APP_ROLE", "all").strip().lower()
+
+# When api and inference run as separate processes, the inference process
+# POSTs every processed frame to the api process at this base URL so that
+# dashboards, /stats and ETags see it (e.g. "http://127.0.0.1:8000").
+# Both processes must share INTERNAL_TOKEN, which authenticates those posts.
+API_NOTIFY_URL = os.getenv("API_NOTIFY_URL", "").rstrip("/")
+INTERNAL_TOKEN = os.getenv("INTERNAL_TOKEN") or None
+
+# Runtime used for detection (see runtimes.py): pytorch | onnx | openvino,
+# optionally with explicit weights (e.g. an INT8 export)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "pytorch").strip().lower()
+INFERENCE_WEIGHTS = os.getenv("INFERENCE_WEIGHTS") or None
+
 REQUIRED_ENV_VARS = [
     "DATABASE_URL",
+]
+
+# Cloudinary is only touched by the inference routes
+INFERENCE_ENV_VARS = [
     "CLOUDINARY_API_KEY",
     "CLOUDINARY_API_SECRET",
     "CLOUDINARY_CLOUD_NAME",
 ]
 
-load_dotenv()
-
 
 def validate_env():
 
+    if APP_ROLE not in APP_ROLES:
+        print(f"Invalid APP_ROLE '{APP_ROLE}', expected one of: {', '.join(APP_ROLES)}")
+        exit(1)
+
+    if APP_ROLE == "inference" and not API_NOTIFY_URL:
+        print("APP_ROLE=inference needs API_NOTIFY_URL pointing at the api process")
+        exit(1)
+
+    if APP_ROLE in ("api", "inference") and not INTERNAL_TOKEN:
+        print(f"APP_ROLE={APP_ROLE} needs INTERNAL_TOKEN (shared by the api and inference processes)")
+        exit(1)
+
+    if APP_ROLE in ("inference", "all"):
+        import runtimes  # stdlib-only at import time
+        try:
+            runtimes.check_backend(INFERENCE_BACKEND, INFERENCE_WEIGHTS)
+        except ValueError as e:
+            print(e)
+            exit(1)
+
+    required = list(REQUIRED_ENV_VARS)
+    if APP_ROLE in ("inference", "all"):
+        required += INFERENCE_ENV_VARS
+
     missing_vars = []
     env_vars = {}
 
-    for var in REQUIRED_ENV_VARS:
+    for var in required:
         value = os.getenv(var)
 
         if value is None:  # Check if the variable is missing
@@ -35,10 +82,32 @@ def validate_env():
 env_vars = validate_env()
 
 MONGO_URI = env_vars["DATABASE_URL"]
-CLOUDINARY_API_KEY = env_vars["CLOUDINARY_API_KEY"]
-CLOUDINARY_API_SECRET = env_vars["CLOUDINARY_API_SECRET"]
-CLOUDINARY_CLOUD_NAME = env_vars["CLOUDINARY_CLOUD_NAME"]
-
-
-
-
+CLOUDINARY_API_KEY = env_vars.get("CLOUDINARY_API_KEY")
+CLOUDINARY_API_SECRET = env_vars.get("CLOUDINARY_API_SECRET")
+CLOUDINARY_CLOUD_NAME = env_vars.get("CLOUDINARY_CLOUD_NAME")
+
+# Upper bound on a raw image upload body (bytes)
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(5 * 1024 * 1024)))
+
+# Inference latency budget: quality is stepped down when recent frames exceed
+# the SLO or more than INFERENCE_MAX_QUEUE frames are in flight
+INFERENCE_LATENCY_SLO_MS = float(os.getenv("INFERENCE_LATENCY_SLO_MS", "8000"))
+INFERENCE_MAX_QUEUE = int(os.getenv("INFERENCE_MAX_QUEUE", "4"))
+
+# How long a process trusts the classroom ETags it remembers before checking
+# Mongo again (bounds staleness when another process wrote the change)
+ETAG_CACHE_TTL_S = float(os.getenv("ETAG_CACHE_TTL_S", "30"))
+
+# How often each process re-seeds its campus stats from Mongo (0 disables),
+# which bounds drift between workers that each only see their own writes
+STATS_RESEED_S = float(os.getenv("STATS_RESEED_S", "60"))
+
+# MongoDB client tuning and failure handling
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "3000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "3000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+MONGO_READ_RETRIES = int(os.getenv("MONGO_READ_RETRIES", "2"))
+MONGO_BREAKER_THRESHOLD = int(os.getenv("MONGO_BREAKER_THRESHOLD", "5"))
+MONGO_BREAKER_RESET_S = float(os.getenv("MONGO_BREAKER_RESET_S", "30"))
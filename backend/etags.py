@@ -0,0 +1,85 @@
+"""
+Strong ETags for the classroom read endpoints.
+
+A classroom's ETag is derived from its document id and `version`, which the
+database layer bumps on every update; the list ETag is a digest of all
+(id, version) pairs. Both are deterministic, so every process computes the
+same tags. Each process also remembers the tags it last served or wrote, so
+an `If-None-Match` that matches a remembered tag is answered with 304
+without a database round trip. Remembered tags expire after `ttl_s`, which
+bounds how long a write made by another process can go unnoticed.
+"""
+import hashlib
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from fastapi import Response
+
+import models
+
+
+def classroom_etag(id: Optional[str], version: int) -> str:
+    return f'"{id}-{version}"'
+
+
+def listing_etag(classrooms: Iterable[models.Classroom]) -> str:
+    digest = hashlib.sha1()
+    for c in classrooms:
+        digest.update(f"{c.id}:{c.version};".encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [t.strip() for t in if_none_match.split(",")]
+    return "*" in candidates or etag in (t[2:] if t.startswith("W/") else t for t in candidates)
+
+
+def tagged(resp: Response, etag: str) -> Response:
+    # no-cache: browsers keep the body but revalidate (with If-None-Match) on every poll
+    resp.headers["ETag"] = etag
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+def not_modified(etag: str) -> Response:
+    return tagged(Response(status_code=304), etag)
+
+
+class ETagCache:
+    def __init__(self, ttl_s: float):
+        self.ttl_s = ttl_s
+        self.rooms: Dict[str, Tuple[str, float]] = {}
+        self.listing: Optional[Tuple[str, float]] = None
+
+    def _fresh(self, entry: Optional[Tuple[str, float]]) -> Optional[str]:
+        if entry and time.monotonic() - entry[1] < self.ttl_s:
+            return entry[0]
+        return None
+
+    def room(self, classId: str) -> Optional[str]:
+        return self._fresh(self.rooms.get(classId))
+
+    def list(self) -> Optional[str]:
+        return self._fresh(self.listing)
+
+    def remember_room(self, classId: str, etag: str) -> str:
+        self.rooms[classId] = (etag, time.monotonic())
+        return etag
+
+    def remember_list(self, etag: str) -> str:
+        self.listing = (etag, time.monotonic())
+        return etag
+
+    def changed(self, classId: str, etag: Optional[str] = None):
+        """Record a write to `classId`: drop the list tag and store (or drop) the room tag."""
+        self.listing = None
+        if etag:
+            self.remember_room(classId, etag)
+        else:
+            self.rooms.pop(classId, None)
+
+    def clear(self):
+        self.rooms.clear()
+        self.listing = None
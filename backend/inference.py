@@ -0,0 +1,204 @@
+"""
+Image decoding, person detection and annotation for classroom frames.
+
+Everything heavy (cv2, numpy, ultralytics/torch, cloudinary) is imported on
+first use, so processes that only serve CRUD / WebSocket traffic never pay
+for it at startup.
+"""
+import threading
+from datetime import datetime
+from typing import List, Sequence
+from zoneinfo import ZoneInfo
+
+
+PERSON_CLASS = 0
+PREDICT_ARGS = dict(imgsz=1920, conf=0.25, iou=0.45, augment=True)
+
+# Degraded settings used under load (load_control.QualityGovernor picks the
+# level): 0 is full quality, higher levels trade recall for latency. Tiled
+# classrooms stay tiled up to TILED_MAX_LEVEL and fall back to a single
+# pass at the level's settings above it.
+QUALITY_LEVELS = [
+    PREDICT_ARGS,
+    dict(PREDICT_ARGS, imgsz=1280, augment=False),
+    dict(PREDICT_ARGS, imgsz=640, augment=False),
+    dict(PREDICT_ARGS, imgsz=640, augment=False),  # + every other frame skipped
+]
+TILED_MAX_LEVEL = 1
+
+# Tiled mode: overlapping tiles at the model's native size, plus the whole
+# frame at that size so people close to the camera are not cut in pieces.
+TILE_SIZE = 640
+TILE_OVERLAP = 0.2
+TILE_PREDICT_ARGS = dict(imgsz=TILE_SIZE, conf=0.25, iou=0.45, classes=[PERSON_CLASS], verbose=False)
+# Boxes whose overlap covers this fraction of the smaller box are the same person
+TILE_MERGE_THRESHOLD = 0.5
+
+_model = None
+_model_lock = threading.Lock()
+# (backend, weights) set by offline tools; the server uses env.INFERENCE_BACKEND / INFERENCE_WEIGHTS
+_backend_override = None
+_cloudinary_configured = False
+
+
+def use_backend(name: str, weights: str = None):
+    """Pick the detection runtime for this process without going through env (offline tools)."""
+    global _backend_override
+    _backend_override = (name, weights)
+
+
+def get_model():
+    """Load the configured detection backend once per process (thread-safe)."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                import runtimes
+                if _backend_override:
+                    name, weights = _backend_override
+                else:
+                    import env
+                    name, weights = env.INFERENCE_BACKEND, env.INFERENCE_WEIGHTS
+                _model = runtimes.load_backend(name, weights)
+    return _model
+
+
+def decode_image(contents: bytes):
+    """Decode JPEG/PNG bytes into a BGR array, or None if the bytes are not an image."""
+    import cv2
+    import numpy as np
+
+    img_array = np.frombuffer(contents, np.uint8)
+    return cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+
+
+def _person_count(result) -> int:
+    return sum(1 for b in result.boxes if int(b.cls[0]) == PERSON_CLASS)
+
+
+def count_people(img, level: int = 0) -> int:
+    results = get_model().predict(img, **QUALITY_LEVELS[level])
+    return _person_count(results[0]) if len(results) else 0
+
+
+def count_people_batch(imgs: Sequence) -> List[int]:
+    """Count people in several frames with a single batched predict call."""
+    if not imgs:
+        return []
+    results = get_model().predict(list(imgs), verbose=False, **PREDICT_ARGS)
+    return [_person_count(r) for r in results]
+
+
+def _tile_offsets(length: int, size: int, stride: int) -> List[int]:
+    if length <= size:
+        return [0]
+    offsets = list(range(0, length - size + 1, stride))
+    if offsets[-1] + size < length:
+        offsets.append(length - size)
+    return offsets
+
+
+def _merge_boxes(boxes, scores, threshold: float) -> int:
+    """Greedy NMS using intersection over the smaller box; returns how many boxes survive."""
+    import numpy as np
+
+    if len(boxes) == 0:
+        return 0
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    kept = 0
+    while order.size:
+        i, rest = order[0], order[1:]
+        kept += 1
+        iw = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        ih = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        overlap = iw * ih / np.maximum(np.minimum(areas[i], areas[rest]), 1e-6)
+        order = rest[overlap < threshold]
+    return kept
+
+
+def count_people_tiled(img) -> int:
+    """
+    Count people by running overlapping native-size tiles (and the whole frame)
+    as one batch and merging detections across tiles.
+    """
+    import numpy as np
+
+    h, w = img.shape[:2]
+    stride = max(1, int(TILE_SIZE * (1 - TILE_OVERLAP)))
+    offsets = [(x, y) for y in _tile_offsets(h, TILE_SIZE, stride) for x in _tile_offsets(w, TILE_SIZE, stride)]
+    crops = [img[y:y + TILE_SIZE, x:x + TILE_SIZE] for x, y in offsets]
+    if len(crops) > 1:
+        crops.append(img)
+        offsets.append((0, 0))
+
+    results = get_model().predict(crops, **TILE_PREDICT_ARGS)
+
+    all_boxes, all_scores = [], []
+    for (x, y), result in zip(offsets, results):
+        if not len(result.boxes):
+            continue
+        all_boxes.append(result.boxes.xyxy.cpu().numpy() + np.array([x, y, x, y], dtype=np.float32))
+        all_scores.append(result.boxes.conf.cpu().numpy())
+    if not all_boxes:
+        return 0
+
+    return _merge_boxes(np.concatenate(all_boxes), np.concatenate(all_scores), TILE_MERGE_THRESHOLD)
+
+
+def count_people_for(img, mode: str = "full", level: int = 0) -> int:
+    if mode == "tiled" and level <= TILED_MAX_LEVEL:
+        return count_people_tiled(img)
+    return count_people(img, level)
+
+
+def annotate(img, occupancy: int, capacity: int) -> bytes:
+    """Draw occupancy and a local timestamp on the frame and return it as JPEG bytes."""
+    import cv2
+
+    now_ng = datetime.now(ZoneInfo("Africa/Lagos"))
+    timestamp = now_ng.strftime("%d %b %Y, %I:%M %p").replace(" 0", " ")
+    # Overlay text: occupancy / capacity
+    label = f"Occupancy: {occupancy}/{capacity}"
+    cv2.putText(img, label, (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 255, 0), 3)
+
+    # Overlay timestamp
+    cv2.putText(img, timestamp, (20, 100), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 0), 2)
+
+    # Encode annotated image to bytes
+    _, encoded = cv2.imencode(".jpg", img)
+    return encoded.tobytes()
+
+
+def _uploader():
+    global _cloudinary_configured
+    import env
+    import cloudinary
+    import cloudinary.uploader
+
+    if not _cloudinary_configured:
+        cloudinary.config(
+            cloud_name=env.CLOUDINARY_CLOUD_NAME,
+            api_key=env.CLOUDINARY_API_KEY,
+            api_secret=env.CLOUDINARY_API_SECRET
+        )
+        _cloudinary_configured = True
+    return cloudinary.uploader
+
+
+def replace_image(annotated_bytes: bytes, previous_url: str = None) -> str:
+    """Upload the annotated frame to Cloudinary, drop the previous one, return the new URL."""
+    uploader = _uploader()
+    upload_result = uploader.upload(annotated_bytes, folder="smart_classrooms")
+    new_url = upload_result["secure_url"]
+
+    # Delete old image if exists
+    if previous_url:
+        public_id = "/".join(previous_url.split("/")[-2:]).split(".")[0]
+        try:
+            uploader.destroy(public_id)
+        except Exception:
+            pass
+
+    return new_url
@@ -0,0 +1,84 @@
+"""
+Load-adaptive quality control for the inference path.
+
+The governor tracks how many frames are in flight and the latency of the
+most recent ones. When the latency SLO or the queue limit is breached it
+steps the quality level down (see `inference.QUALITY_LEVELS`); once load
+has stayed well below the SLO it steps back up. A cooldown between changes
+keeps it from flapping.
+
+At the last level every other frame per classroom is skipped entirely.
+"""
+import time
+from collections import deque
+from typing import Dict
+
+
+class QualityGovernor:
+    def __init__(self, slo_ms: float, max_queue: int, max_level: int,
+                 window: int = 20, cooldown_s: float = 15.0):
+        self.slo_ms = slo_ms
+        self.max_queue = max_queue
+        self.max_level = max_level
+        self.cooldown_s = cooldown_s
+        self.level = 0
+        self.in_flight = 0
+        self.latencies = deque(maxlen=window)
+        self.skipped = 0
+        self._last_change = 0.0
+        self._skip_next: Dict[str, bool] = {}
+
+    def recent_p90(self) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+
+    def should_skip(self, classId: str) -> bool:
+        """At the lowest level, alternate processing and skipping frames per classroom."""
+        if self.level < self.max_level:
+            self._skip_next.pop(classId, None)
+            return False
+        skip = self._skip_next.get(classId, False)
+        self._skip_next[classId] = not skip
+        if skip:
+            self.skipped += 1
+        return skip
+
+    def start(self) -> float:
+        self.in_flight += 1
+        if self.in_flight > self.max_queue:
+            self._step(+1)
+        return time.monotonic()
+
+    def finish(self, started: float):
+        self.in_flight -= 1
+        self.latencies.append((time.monotonic() - started) * 1000)
+        self._adjust()
+
+    def _adjust(self):
+        p90 = self.recent_p90()
+        if p90 > self.slo_ms:
+            self._step(+1)
+        elif p90 < self.slo_ms * 0.5 and self.in_flight <= self.max_queue // 2:
+            self._step(-1)
+
+    def _step(self, direction: int):
+        now = time.monotonic()
+        new_level = min(self.max_level, max(0, self.level + direction))
+        if new_level == self.level or now - self._last_change < self.cooldown_s:
+            return
+        self.level = new_level
+        self._last_change = now
+        # latencies measured at the previous level no longer say much about this one
+        self.latencies.clear()
+
+    def snapshot(self) -> dict:
+        return {
+            "qualityLevel": self.level,
+            "maxQualityLevel": self.max_level,
+            "inFlight": self.in_flight,
+            "latencyP90Ms": round(self.recent_p90(), 1),
+            "latencySloMs": self.slo_ms,
+            "skippedFrames": self.skipped,
+        }
@@ -3,19 +3,21 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
+import asyncio
 import logging
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from typing import List
+from typing import List, Optional
 
 from fastapi import (
     FastAPI, HTTPException,
-    UploadFile, File, Form,
+    UploadFile, File, Form, Header, Request,
     WebSocket, WebSocketDisconnect,
     BackgroundTasks
 )
 
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 
 import httpx
 
@@ -23,7 +25,7 @@ import httpx
 from send_email import EmailService
 
 # your existing modules (same as in your main app)
-import database, models, schemas, env
+import bulk, database, etags, models, schemas, env, stats, wire
 
 # load .env (optional)
 
@@ -40,15 +42,18 @@ logger = logging.getLogger("smart-classroom-proxy")
 # -------------------------------------------------------
 # HELPERS
 # -------------------------------------------------------
-def serialize(obj):
-    """Serialize datetimes and nested structures for JSON broadcasting."""
-    if isinstance(obj, dict):
-        return {k: serialize(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [serialize(v) for v in obj]
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    return obj
+async def read_body_capped(request: Request, limit: int) -> bytes:
+    """Read a raw request body into memory, rejecting it once it exceeds `limit` bytes."""
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > limit:
+        raise HTTPException(413, "image too large")
+
+    buf = bytearray()
+    async for chunk in request.stream():
+        buf.extend(chunk)
+        if len(buf) > limit:
+            raise HTTPException(413, "image too large")
+    return bytes(buf)
 
 
 class ConnectionManager:
@@ -67,10 +72,12 @@ class ConnectionManager:
 
     async def broadcast(self, data: dict):
         logger.info("Broadcasting %s to %d clients", data.get("event"), len(self.active))
+        # Encode once, send the same text to every client
+        text = wire.dumps(data)
         dead = []
         for ws in self.active:
             try:
-                await ws.send_json(data)
+                await ws.send_text(text)
             except Exception as e:
                 logger.exception("WS send failed: %s", e)
                 dead.append(ws)
@@ -81,12 +88,38 @@ class ConnectionManager:
 
 
 manager = ConnectionManager()
+occupancy_stats = stats.OccupancyStats()
+etag_cache = etags.ETagCache(ttl_s=env.ETAG_CACHE_TTL_S)
+
+
+async def ensure_stats_loaded():
+    if not occupancy_stats.loaded:
+        occupancy_stats.load(await database.list_occupancy())
+
+
+async def reseed_stats_periodically():
+    while True:
+        await asyncio.sleep(env.STATS_RESEED_S)
+        try:
+            before = occupancy_stats.snapshot()
+            occupancy_stats.load(await database.list_occupancy())
+            if occupancy_stats.snapshot() != before:
+                await publish_stats()
+        except Exception as e:
+            logger.warning("Could not re-seed occupancy stats: %s", e)
+
+
+async def publish_stats():
+    await manager.broadcast({"event": "stats_updated", "stats": occupancy_stats.snapshot()})
 
 
 # -------------------------------------------------------
 # APP
 # -------------------------------------------------------
-app = FastAPI(title="Smart Classroom (lightweight proxy)")
+app = FastAPI(
+    title="Smart Classroom (lightweight proxy)",
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -127,9 +160,31 @@ async def healthz():
     return {
         "status": "ok",
         "service": "smart-classroom-api",
+        "database": database.breaker.state,
         "timestamp": datetime.utcnow().isoformat()
     }
 
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return "\n".join(database.metrics_lines()) + "\n"
+
+@app.on_event("startup")
+async def load_stats():
+    try:
+        await ensure_stats_loaded()
+    except Exception as e:
+        logger.exception("Could not seed occupancy stats at startup: %s", e)
+    if env.STATS_RESEED_S > 0:
+        asyncio.create_task(reseed_stats_periodically())
+
+
+@app.get("/stats", response_model=schemas.ResponseModel)
+async def get_stats():
+    await ensure_stats_loaded()
+    return wire.respond("ok", {"stats": occupancy_stats.snapshot()})
+
+
 # -------------------------------------------------------
 # CRUD ENDPOINTS (same behavior as your main app)
 # -------------------------------------------------------
@@ -142,34 +197,77 @@ async def create_classroom(req: schemas.CreateClassroomRequest):
     classroom = models.Classroom(**req.model_dump())
     inserted_id = await database.add_classroom(classroom)
 
-    return {
-        "success": True,
-        "message": "classroom created",
-        "data": {"id": inserted_id}
-    }
+    occupancy_stats.upsert(classroom.classId, classroom.occupancy, classroom.capacity)
+    etag_cache.changed(classroom.classId)
+    await publish_stats()
+
+    return wire.respond("classroom created", {"id": inserted_id})
 
 
 @app.get("/classrooms", response_model=schemas.ResponseModel)
-async def get_classrooms():
+async def get_classrooms(if_none_match: Optional[str] = Header(None)):
+    known = etag_cache.list()
+    if known and etags.matches(if_none_match, known):
+        return etags.not_modified(known)
+
     docs = await database.list_classrooms()
-    return {
-        "success": True,
-        "message": "ok",
-        "data": {"classrooms": [d.model_dump() for d in docs]}
-    }
+    etag = etag_cache.remember_list(etags.listing_etag(docs))
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+
+    return etags.tagged(wire.respond("ok", {"classrooms": [wire.classroom_to_wire(d) for d in docs]}), etag)
+
+
+# -------------------------------------------------------
+# BULK IMPORT / EXPORT
+# (declared before /classrooms/{classId} so the paths are not captured by it)
+# -------------------------------------------------------
+@app.post("/classrooms/bulk", response_model=schemas.ResponseModel)
+async def bulk_import_classrooms(request: Request, ordered: bool = False):
+    fmt = bulk.detect_format(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(415, "expected a text/csv or application/x-ndjson body")
+
+    summary = await bulk.import_rows(bulk.iter_lines(request.stream()), fmt, ordered=ordered)
+
+    if summary["inserted"] or summary["updated"]:
+        etag_cache.clear()
+        occupancy_stats.load(await database.list_occupancy())
+        await publish_stats()
+
+    return wire.respond("bulk import complete", summary, success=not summary["errors"])
+
+
+@app.get("/classrooms/export")
+async def export_classrooms(format: str = "ndjson"):
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(400, "format must be 'ndjson' or 'csv'")
+
+    # Opens the cursor and reads the first batch now, so database errors get a real status
+    classrooms = await database.iter_classrooms()
+    if format == "ndjson":
+        return StreamingResponse(bulk.export_ndjson(classrooms), media_type="application/x-ndjson")
+    return StreamingResponse(
+        bulk.export_csv(classrooms), media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="classrooms.csv"'},
+    )
 
 
 @app.get("/classrooms/{classId}", response_model=schemas.ResponseModel)
-async def get_classroom(classId: str):
+async def get_classroom(classId: str, if_none_match: Optional[str] = Header(None)):
+    known = etag_cache.room(classId)
+    if known and etags.matches(if_none_match, known):
+        return etags.not_modified(known)
+
     doc = await database.get_classroom_by_classId(classId)
     if not doc:
         raise HTTPException(404, "classroom not found")
 
-    return {
-        "success": True,
-        "message": "ok",
-        "data": {"classroom": doc.model_dump()}
-    }
+    etag = etag_cache.remember_room(classId, etags.classroom_etag(doc.id, doc.version))
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+
+    return etags.tagged(wire.respond("ok", {"classroom": wire.classroom_to_wire(doc)}), etag)
 
 
 @app.put("/classrooms/{classId}", response_model=schemas.ResponseModel)
@@ -183,6 +281,13 @@ async def update_classroom(
     if not existing:
         raise HTTPException(404, "classroom not found")
 
+    try:
+        schemas.check_capture_bounds(
+            payload.get("captureMinS", existing.captureMinS), payload.get("captureMaxS", existing.captureMaxS)
+        )
+    except ValueError as e:
+        raise HTTPException(422, str(e))
+
     if payload.get("classId") and payload.get("classId") != classId:
         other = await database.get_classroom_by_classId(payload["classId"])
         if other:
@@ -190,24 +295,17 @@ async def update_classroom(
 
     updated = await database.update_classroom_by_classId(classId, payload)
 
-    updated_dict = updated.model_dump()
-    if "_id" in updated_dict:
-        updated_dict["_id"] = str(updated_dict["_id"])
-
-    for dt_key in ("createdAt", "updatedAt"):
-        if updated_dict.get(dt_key):
-            try:
-                updated_dict[dt_key] = updated_dict[dt_key].isoformat()
-            except Exception:
-                pass
+    updated_dict = wire.classroom_to_wire(updated)
+    occupancy_stats.upsert(updated.classId, updated.occupancy, updated.capacity, previous_classId=classId)
+    etag_cache.changed(classId)
+    etag_cache.changed(updated.classId, etags.classroom_etag(updated.id, updated.version))
 
     # 🔔 WebSocket push (immediate)
-    await manager.broadcast(
-        serialize({
-            "event": "classroom_updated",
-            "classroom": updated_dict
-        })
-    )
+    await manager.broadcast({
+        "event": "classroom_updated",
+        "classroom": updated_dict
+    })
+    await publish_stats()
 
     # 📧 OCCUPANCY EMAIL (scheduled, non-blocking)
     try:
@@ -235,11 +333,7 @@ async def update_classroom(
     except Exception as e:
         logger.exception("Failed to schedule occupancy alert email: %s", e)
 
-    return {
-        "success": True,
-        "message": "updated",
-        "data": {"classroom": updated.model_dump()}
-    }
+    return wire.respond("updated", {"classroom": updated_dict})
 
 
 @app.delete("/classrooms/{classId}", response_model=schemas.ResponseModel)
@@ -248,60 +342,47 @@ async def delete_classroom(classId: str):
     if not ok:
         raise HTTPException(404, "classroom not found")
 
-    return {
-        "success": True,
-        "message": "deleted",
-        "data": None
-    }
+    occupancy_stats.remove(classId)
+    etag_cache.changed(classId)
+    await publish_stats()
+
+    return wire.respond("deleted")
 
 
 # -------------------------------------------------------
 # IMAGE ENDPOINT (FORWARD to HEAVY BACKEND)
 # -------------------------------------------------------
-@app.post("/classrooms/{classId}/image", response_model=schemas.ResponseModel)
-async def upload_image(
-    classId: str,
-    background_tasks: BackgroundTasks,
-    deviceId: str = Form(...),
-    file: UploadFile = File(...)
-):
-    classroom = await database.get_classroom_by_classId(classId)
-    if not classroom:
-        raise HTTPException(404, "classroom not found")
-
-    if classroom.deviceId != deviceId:
-        raise HTTPException(400, "deviceId mismatch")
-
-    contents = await file.read()
-    forward_url = f"{HEAVY_BACKEND_URL}/classrooms/{classId}/image"
-    logger.info("Forwarding image to heavy backend %s", forward_url)
-
+async def forward_image(classId: str, background_tasks: BackgroundTasks, post):
+    """Send an image to the heavy backend via `post(client)` and fan out the result."""
     try:
         async with httpx.AsyncClient(timeout=30.0) as client:
-            files = {"file": (file.filename or "upload.jpg", contents, file.content_type)}
-            data = {"deviceId": deviceId}
-            resp = await client.post(forward_url, data=data, files=files)
+            resp = await post(client)
 
         resp.raise_for_status()
         resp_json = resp.json()
 
-        classroom_payload = resp_json.get("data", {}).get("classroom")
+        data = resp_json.get("data") or {}
+        classroom_payload = data.get("classroom")
+        # A skipped frame carries the unchanged classroom; nothing to fan out
+        skipped = data.get("skipped", False)
 
-        if classroom_payload:
-            # Normalize
-            if "_id" in classroom_payload:
-                classroom_payload["_id"] = str(classroom_payload["_id"])
-
-            for dt_key in ("createdAt", "updatedAt"):
-                if classroom_payload.get(dt_key):
-                    if isinstance(classroom_payload[dt_key], datetime):
-                        classroom_payload[dt_key] = classroom_payload[dt_key].isoformat()
+        if classroom_payload and not skipped:
+            occupancy_stats.upsert(
+                classroom_payload.get("classId", classId),
+                classroom_payload.get("occupancy"),
+                classroom_payload.get("capacity"),
+            )
+            etag_cache.changed(
+                classroom_payload.get("classId", classId),
+                etags.classroom_etag(classroom_payload.get("id"), classroom_payload.get("version", 0)),
+            )
 
-            # 🔊 WebSocket first
-            await manager.broadcast(serialize({
+            # 🔊 WebSocket first (payload is already wire-format JSON from the heavy backend)
+            await manager.broadcast({
                 "event": "classroom_image_update",
                 "classroom": classroom_payload
-            }))
+            })
+            await publish_stats()
 
             # ✉️ Schedule email (NON-BLOCKING)
             occupancy_after = classroom_payload.get("occupancy")
@@ -326,12 +407,72 @@ async def upload_image(
                     capacity_after
                 )
 
-        return resp_json
+        # Pass the recommended capture interval through to the device
+        result = wire.respond(
+            resp_json.get("message", ""), resp_json.get("data"), success=resp_json.get("success", True)
+        )
+        if "X-Next-Capture-S" in resp.headers:
+            result.headers["X-Next-Capture-S"] = resp.headers["X-Next-Capture-S"]
+        return result
 
     except Exception as e:
         logger.exception("Heavy backend unavailable or error occurred: %s", e)
-        return schemas.ResponseModel(
-            success=False,
-            message="image analytics server currently unavailable",
-            data=None
-        ).model_dump()
\ No newline at end of file
+        return wire.respond("image analytics server currently unavailable", success=False)
+
+
+@app.post("/classrooms/{classId}/image", response_model=schemas.ResponseModel)
+async def upload_image(
+    classId: str,
+    background_tasks: BackgroundTasks,
+    deviceId: str = Form(...),
+    file: UploadFile = File(...)
+):
+    classroom = await database.get_classroom_by_classId(classId)
+    if not classroom:
+        raise HTTPException(404, "classroom not found")
+
+    if classroom.deviceId != deviceId:
+        raise HTTPException(400, "deviceId mismatch")
+
+    contents = await file.read()
+    forward_url = f"{HEAVY_BACKEND_URL}/classrooms/{classId}/image"
+    logger.info("Forwarding image to heavy backend %s", forward_url)
+
+    files = {"file": (file.filename or "upload.jpg", contents, file.content_type)}
+    data = {"deviceId": deviceId}
+    return await forward_image(
+        classId, background_tasks,
+        lambda client: client.post(forward_url, data=data, files=files),
+    )
+
+
+@app.post("/classrooms/{classId}/image/raw", response_model=schemas.ResponseModel)
+async def upload_image_raw(
+    classId: str,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    x_device_id: str = Header(...),
+):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type != "image/jpeg":
+        raise HTTPException(415, "expected an image/jpeg request body")
+
+    classroom = await database.get_classroom_by_classId(classId)
+    if not classroom:
+        raise HTTPException(404, "classroom not found")
+
+    if classroom.deviceId != x_device_id:
+        raise HTTPException(400, "deviceId mismatch")
+
+    contents = await read_body_capped(request, env.MAX_IMAGE_BYTES)
+    if not contents:
+        raise HTTPException(400, "empty image")
+
+    forward_url = f"{HEAVY_BACKEND_URL}/classrooms/{classId}/image/raw"
+    logger.info("Forwarding raw image to heavy backend %s", forward_url)
+
+    headers = {"Content-Type": "image/jpeg", "X-Device-Id": x_device_id}
+    return await forward_image(
+        classId, background_tasks,
+        lambda client: client.post(forward_url, content=contents, headers=headers),
+    )
@@ -1,33 +1,22 @@
 from fastapi import (
-    FastAPI, HTTPException, status,
-    UploadFile, File, Form, Response, WebSocket, WebSocketDisconnect
+    APIRouter, FastAPI, HTTPException, status,
+    UploadFile, File, Form, Header, Request, Response, WebSocket, WebSocketDisconnect
 )
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 
+import asyncio
+import hmac
+import httpx
 from datetime import datetime
-from zoneinfo import ZoneInfo
-
-from typing import List
-from io import BytesIO
-import cv2
-import numpy as np
+from typing import List, Optional
 import logging
 
-import database, models, schemas, env
+import bulk, capture, database, etags, load_control, models, schemas, env, stats, wire
 
-from ultralytics import YOLO
-import cloudinary
-import cloudinary.uploader
-
-
-# -------------------------------------------------------
-# CLOUDINARY CONFIG
-# -------------------------------------------------------
-cloudinary.config(
-    cloud_name=env.CLOUDINARY_CLOUD_NAME,
-    api_key=env.CLOUDINARY_API_KEY,
-    api_secret=env.CLOUDINARY_API_SECRET
-)
+# cv2 / numpy / ultralytics / cloudinary live behind `inference` and are only
+# imported when the first frame is processed.
+import inference
 
 
 logging.basicConfig(level=logging.INFO)
@@ -38,15 +27,6 @@ logger = logging.getLogger("smart-classroom")
 # GLOBAL WEBSOCKET MANAGER
 # -------------------------------------------------------
 
-def serialize(obj):
-    if isinstance(obj, dict):
-        return {k: serialize(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [serialize(v) for v in obj]
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    return obj
-
 class ConnectionManager:
     def __init__(self):
         self.active: List[WebSocket] = []
@@ -63,10 +43,12 @@ class ConnectionManager:
 
     async def broadcast(self, data: dict):
         logger.info("Broadcasting %s to %d clients", data.get("event"), len(self.active))
+        # Encode once, send the same text to every client
+        text = wire.dumps(data)
         dead = []
         for ws in self.active:
             try:
-                await ws.send_json(data)
+                await ws.send_text(text)
             except Exception as e:
                 logger.exception("WS send failed: %s", e)
                 dead.append(ws)
@@ -77,12 +59,81 @@ class ConnectionManager:
 
 
 manager = ConnectionManager()
+occupancy_stats = stats.OccupancyStats()
+etag_cache = etags.ETagCache(ttl_s=env.ETAG_CACHE_TTL_S)
+governor = load_control.QualityGovernor(
+    slo_ms=env.INFERENCE_LATENCY_SLO_MS,
+    max_queue=env.INFERENCE_MAX_QUEUE,
+    max_level=len(inference.QUALITY_LEVELS) - 1,
+)
+capture_planner = capture.CapturePlanner()
+
+
+async def ensure_stats_loaded():
+    if not occupancy_stats.loaded:
+        occupancy_stats.load(await database.list_occupancy())
+
+
+async def reseed_stats_periodically():
+    while True:
+        await asyncio.sleep(env.STATS_RESEED_S)
+        try:
+            before = occupancy_stats.snapshot()
+            occupancy_stats.load(await database.list_occupancy())
+            if occupancy_stats.snapshot() != before:
+                await publish_stats()
+        except Exception as e:
+            logger.warning("Could not re-seed occupancy stats: %s", e)
+
+
+async def publish_stats():
+    await manager.broadcast({"event": "stats_updated", "stats": occupancy_stats.snapshot()})
+
+
+async def announce_image_update(classroom: models.Classroom, classroom_dict: dict):
+    """Stats, ETags and WebSocket fan-out for a processed frame (api side)."""
+    occupancy_stats.upsert(classroom.classId, classroom.occupancy, classroom.capacity)
+    etag_cache.changed(classroom.classId, etags.classroom_etag(classroom.id, classroom.version))
+
+    await manager.broadcast({
+        "event": "classroom_image_update",
+        "classroom": classroom_dict
+    })
+    await publish_stats()
+
+
+async def notify_api(classroom_dict: dict):
+    """Inference-only process: hand a processed frame to the api process."""
+    headers = {"Content-Type": "application/json", "X-Internal-Token": env.INTERNAL_TOKEN}
+    try:
+        async with httpx.AsyncClient(timeout=2.0) as client:
+            resp = await client.post(
+                f"{env.API_NOTIFY_URL}/internal/image-updates",
+                content=wire.dumps({"classroom": classroom_dict}),
+                headers=headers,
+            )
+        resp.raise_for_status()
+    except Exception as e:
+        logger.exception("Could not notify api process of image update: %s", e)
 
 
 # -------------------------------------------------------
 # FASTAPI APP
 # -------------------------------------------------------
-app = FastAPI(title="Smart Classroom - FastAPI + YOLO + MongoDB")
+app = FastAPI(
+    title="Smart Classroom - FastAPI + YOLO + MongoDB",
+    default_response_class=ORJSONResponse,
+)
+
+# CRUD + WebSocket routes and frame-processing routes are mounted according to
+# APP_ROLE, so API-only workers can be started without the inference stack.
+# A separate inference process reports each processed frame to the api process
+# (API_NOTIFY_URL -> /internal/image-updates, authenticated by INTERNAL_TOKEN),
+# which owns the WebSocket clients, /stats and the ETag cache.
+api_router = APIRouter()
+inference_router = APIRouter()
+# Only mounted when api and inference run as separate processes
+internal_router = APIRouter(include_in_schema=False)
 
 app.add_middleware(
     CORSMiddleware,
@@ -94,7 +145,7 @@ app.add_middleware(
 # -------------------------------------------------------
 # WEBSOCKET ENDPOINT
 # -------------------------------------------------------
-@app.websocket("/ws")
+@api_router.websocket("/ws")
 async def websocket_endpoint(ws: WebSocket):
     await manager.connect(ws)
     try:
@@ -114,10 +165,81 @@ async def websocket_endpoint(ws: WebSocket):
         manager.disconnect(ws)
 
 
+# -------------------------------------------------------
+# HEALTH + METRICS
+# -------------------------------------------------------
+@app.get("/healthz")
+async def healthz():
+    return {
+        "status": "ok",
+        "service": "smart-classroom-api",
+        "role": env.APP_ROLE,
+        "inference": governor.snapshot(),
+        "database": database.breaker.state,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    snap = governor.snapshot()
+    return "\n".join([
+        "# TYPE inference_quality_level gauge",
+        f"inference_quality_level {snap['qualityLevel']}",
+        "# TYPE inference_in_flight gauge",
+        f"inference_in_flight {snap['inFlight']}",
+        "# TYPE inference_latency_p90_ms gauge",
+        f"inference_latency_p90_ms {snap['latencyP90Ms']}",
+        "# TYPE inference_skipped_frames_total counter",
+        f"inference_skipped_frames_total {snap['skippedFrames']}",
+        *database.metrics_lines(),
+    ]) + "\n"
+
+
+# -------------------------------------------------------
+# IMAGE UPDATES FROM A SEPARATE INFERENCE PROCESS
+# -------------------------------------------------------
+@internal_router.post("/internal/image-updates")
+async def receive_image_update(request: Request, x_internal_token: Optional[str] = Header(None)):
+    if not hmac.compare_digest(x_internal_token or "", env.INTERNAL_TOKEN):
+        raise HTTPException(403, "forbidden")
+
+    try:
+        payload = (await request.json())["classroom"]
+        # wire dicts carry the document id as "id"; the model reads it from "_id"
+        classroom = models.Classroom(**dict(payload, _id=payload.get("id")))
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise HTTPException(422, f"invalid classroom payload: {e}")
+
+    await announce_image_update(classroom, wire.classroom_to_wire(classroom))
+    return wire.respond("ok")
+
+
+# -------------------------------------------------------
+# CAMPUS-WIDE STATS
+# -------------------------------------------------------
+@app.on_event("startup")
+async def load_stats():
+    if env.APP_ROLE not in ("api", "all"):
+        return
+    try:
+        await ensure_stats_loaded()
+    except Exception as e:
+        logger.exception("Could not seed occupancy stats at startup: %s", e)
+    if env.STATS_RESEED_S > 0:
+        asyncio.create_task(reseed_stats_periodically())
+
+
+@api_router.get("/stats", response_model=schemas.ResponseModel)
+async def get_stats():
+    await ensure_stats_loaded()
+    return wire.respond("ok", {"stats": occupancy_stats.snapshot()})
+
+
 # -------------------------------------------------------
 # CREATE CLASSROOM
 # -------------------------------------------------------
-@app.post("/classrooms", response_model=schemas.ResponseModel)
+@api_router.post("/classrooms", response_model=schemas.ResponseModel)
 async def create_classroom(req: schemas.CreateClassroomRequest):
     existing = await database.get_classroom_by_classId(req.classId)
     if existing:
@@ -126,52 +248,102 @@ async def create_classroom(req: schemas.CreateClassroomRequest):
     classroom = models.Classroom(**req.model_dump())
     inserted_id = await database.add_classroom(classroom)
 
-    return {
-        "success": True,
-        "message": "classroom created",
-        "data": {"id": inserted_id}
-    }
+    occupancy_stats.upsert(classroom.classId, classroom.occupancy, classroom.capacity)
+    etag_cache.changed(classroom.classId)
+    await publish_stats()
+
+    return wire.respond("classroom created", {"id": inserted_id})
 
 
 # -------------------------------------------------------
 # LIST CLASSROOMS
 # -------------------------------------------------------
-@app.get("/classrooms", response_model=schemas.ResponseModel)
-async def get_classrooms():
+@api_router.get("/classrooms", response_model=schemas.ResponseModel)
+async def get_classrooms(if_none_match: Optional[str] = Header(None)):
+    known = etag_cache.list()
+    if known and etags.matches(if_none_match, known):
+        return etags.not_modified(known)
+
     docs = await database.list_classrooms()
-    return {
-        "success": True,
-        "message": "ok",
-        "data": {"classrooms": [d.model_dump() for d in docs]}
-    }
+    etag = etag_cache.remember_list(etags.listing_etag(docs))
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+
+    return etags.tagged(wire.respond("ok", {"classrooms": [wire.classroom_to_wire(d) for d in docs]}), etag)
+
+
+# -------------------------------------------------------
+# BULK IMPORT / EXPORT
+# (declared before /classrooms/{classId} so the paths are not captured by it)
+# -------------------------------------------------------
+@api_router.post("/classrooms/bulk", response_model=schemas.ResponseModel)
+async def bulk_import_classrooms(request: Request, ordered: bool = False):
+    fmt = bulk.detect_format(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(415, "expected a text/csv or application/x-ndjson body")
+
+    summary = await bulk.import_rows(bulk.iter_lines(request.stream()), fmt, ordered=ordered)
+
+    if summary["inserted"] or summary["updated"]:
+        etag_cache.clear()
+        occupancy_stats.load(await database.list_occupancy())
+        await publish_stats()
+
+    return wire.respond("bulk import complete", summary, success=not summary["errors"])
+
+
+@api_router.get("/classrooms/export")
+async def export_classrooms(format: str = "ndjson"):
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(400, "format must be 'ndjson' or 'csv'")
+
+    # Opens the cursor and reads the first batch now, so database errors get a real status
+    classrooms = await database.iter_classrooms()
+    if format == "ndjson":
+        return StreamingResponse(bulk.export_ndjson(classrooms), media_type="application/x-ndjson")
+    return StreamingResponse(
+        bulk.export_csv(classrooms), media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="classrooms.csv"'},
+    )
 
 
 # -------------------------------------------------------
 # GET ONE CLASSROOM
 # -------------------------------------------------------
-@app.get("/classrooms/{classId}", response_model=schemas.ResponseModel)
-async def get_classroom(classId: str):
+@api_router.get("/classrooms/{classId}", response_model=schemas.ResponseModel)
+async def get_classroom(classId: str, if_none_match: Optional[str] = Header(None)):
+    known = etag_cache.room(classId)
+    if known and etags.matches(if_none_match, known):
+        return etags.not_modified(known)
+
     doc = await database.get_classroom_by_classId(classId)
     if not doc:
         raise HTTPException(404, "classroom not found")
 
-    return {
-        "success": True,
-        "message": "ok",
-        "data": {"classroom": doc.model_dump()}
-    }
+    etag = etag_cache.remember_room(classId, etags.classroom_etag(doc.id, doc.version))
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+
+    return etags.tagged(wire.respond("ok", {"classroom": wire.classroom_to_wire(doc)}), etag)
 
 
 # -------------------------------------------------------
 # UPDATE CLASSROOM
 # -------------------------------------------------------
-@app.put("/classrooms/{classId}", response_model=schemas.ResponseModel)
+@api_router.put("/classrooms/{classId}", response_model=schemas.ResponseModel)
 async def update_classroom(classId: str, req: schemas.UpdateClassroomRequest):
     payload = {k: v for k, v in req.model_dump().items() if v is not None}
     existing = await database.get_classroom_by_classId(classId)
     if not existing:
         raise HTTPException(404, "classroom not found")
 
+    try:
+        schemas.check_capture_bounds(
+            payload.get("captureMinS", existing.captureMinS), payload.get("captureMaxS", existing.captureMaxS)
+        )
+    except ValueError as e:
+        raise HTTPException(422, str(e))
+
     if payload.get("classId") != classId:
         # Check for classId uniqueness
         other = await database.get_classroom_by_classId(payload["classId"])
@@ -180,136 +352,143 @@ async def update_classroom(classId: str, req: schemas.UpdateClassroomRequest):
 
     updated = await database.update_classroom_by_classId(classId, payload)
 
-    updated_dict = updated.model_dump()
-    if "_id" in updated_dict:
-        updated_dict["_id"] = str(updated_dict["_id"])
-    for dt_key in ("createdAt", "updatedAt"):
-        if dt_key in updated_dict and updated_dict[dt_key] is not None:
-            try:
-                updated_dict[dt_key] = updated_dict[dt_key].isoformat()
-            except Exception:
-                pass
+    updated_dict = wire.classroom_to_wire(updated)
+    occupancy_stats.upsert(updated.classId, updated.occupancy, updated.capacity, previous_classId=classId)
+    etag_cache.changed(classId)
+    etag_cache.changed(updated.classId, etags.classroom_etag(updated.id, updated.version))
 
     # WebSocket push
-    await manager.broadcast(serialize({"event": "classroom_updated", "classroom": updated_dict}))
+    await manager.broadcast({"event": "classroom_updated", "classroom": updated_dict})
+    await publish_stats()
 
-    return {
-        "success": True,
-        "message": "updated",
-        "data": {"classroom": updated.model_dump()}
-    }
+    return wire.respond("updated", {"classroom": updated_dict})
 
 
 # -------------------------------------------------------
 # DELETE CLASSROOM
 # -------------------------------------------------------
-@app.delete("/classrooms/{classId}", response_model=schemas.ResponseModel)
+@api_router.delete("/classrooms/{classId}", response_model=schemas.ResponseModel)
 async def delete_classroom(classId: str):
     ok = await database.delete_classroom_by_classId(classId)
     if not ok:
         raise HTTPException(404, "classroom not found")
 
-    return {
-        "success": True,
-        "message": "deleted",
-        "data": None
-    }
+    occupancy_stats.remove(classId)
+    etag_cache.changed(classId)
+    capture_planner.forget(classId)
+    await publish_stats()
+
+    return wire.respond("deleted")
 
 
 # -------------------------------------------------------
 # YOLO IMAGE + CLOUDINARY + BROADCAST
 # -------------------------------------------------------
-@app.post("/classrooms/{classId}/image", response_model=schemas.ResponseModel)
-async def upload_image(classId: str, deviceId: str = Form(...), file: UploadFile = File(...)):
-    classroom = await database.get_classroom_by_classId(classId)
-    if not classroom:
-        raise HTTPException(404, "classroom not found")
+async def read_body_capped(request: Request, limit: int) -> bytes:
+    """Read a raw request body into memory, rejecting it once it exceeds `limit` bytes."""
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > limit:
+        raise HTTPException(413, "image too large")
 
-    if classroom.deviceId != deviceId:
-        raise HTTPException(400, "deviceId mismatch")
+    buf = bytearray()
+    async for chunk in request.stream():
+        buf.extend(chunk)
+        if len(buf) > limit:
+            raise HTTPException(413, "image too large")
+    return bytes(buf)
 
-    contents = await file.read()
+
+def image_response(message: str, classroom: models.Classroom, classroom_dict: dict, skipped: bool = False):
+    """Image upload reply, carrying the recommended wait before the next capture."""
+    next_capture = capture_planner.next_interval(classroom, governor.level)
+    resp = wire.respond(message, {"classroom": classroom_dict, "nextCaptureS": next_capture, "skipped": skipped})
+    resp.headers["X-Next-Capture-S"] = str(next_capture)
+    return resp
+
+
+async def process_classroom_image(classId: str, classroom: models.Classroom, contents: bytes):
+    # Under heavy load only every other frame per classroom is processed
+    if governor.should_skip(classId):
+        return image_response("frame skipped under load", classroom, wire.classroom_to_wire(classroom), skipped=True)
 
     # Decode image
-    img_array = np.frombuffer(contents, np.uint8)
-    img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+    img = inference.decode_image(contents)
     if img is None:
         raise HTTPException(400, "invalid image")
 
-    import asyncio
     loop = asyncio.get_running_loop()
 
-    # Lazy load YOLO if not already
-    model = getattr(app.state, "yolo_model", None)
-    if model is None:
-        model = await loop.run_in_executor(None, lambda: YOLO("yolov8n.pt"))
-        app.state.yolo_model = model
+    # Model load (first call) and YOLO run in the executor to avoid blocking
+    started = governor.start()
+    level = governor.level  # start() may have just stepped down for queue depth
+    try:
+        person_count = await loop.run_in_executor(
+            None, inference.count_people_for, img, classroom.inferenceMode, level
+        )
+    finally:
+        governor.finish(started)
+    new_occupancy = min(person_count, classroom.capacity)
+
+    annotated_bytes = inference.annotate(img, new_occupancy, classroom.capacity)
+    new_url = inference.replace_image(annotated_bytes, classroom.latestImage)
 
-    # Run YOLO in executor to avoid blocking
-    results = await loop.run_in_executor(
-        None,
-        lambda: model.predict(img, imgsz=1920, conf=0.25, iou=0.45, augment=True)
-    )
+    # Update DB
+    updated = await database.update_classroom_by_classId(classId, {"occupancy": new_occupancy, "latestImage": new_url})
+    if not updated:
+        raise HTTPException(404, "classroom not found")
 
-    boxes = results[0].boxes if len(results) else []
-    person_count = sum(1 for b in boxes if int(b.cls[0]) == 0)
-    new_occupancy = min(person_count, classroom.capacity)
+    updated_dict = wire.classroom_to_wire(updated)
+    capture_planner.record(classId, person_count)
 
-    now_ng = datetime.now(ZoneInfo("Africa/Lagos"))
-    timestamp = now_ng.strftime("%d %b %Y, %I:%M %p").replace(" 0", " ")
-    # Overlay text: occupancy / capacity
-    label = f"Occupancy: {new_occupancy}/{classroom.capacity}"
-    cv2.putText(img, label, (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 255, 0), 3)
+    # Stats / ETags / WebSocket live with the api routes, possibly in another process
+    if env.APP_ROLE == "all":
+        await announce_image_update(updated, updated_dict)
+    else:
+        await notify_api(updated_dict)
 
-    # Overlay timestamp
-    cv2.putText(img, timestamp, (20, 100), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 0), 2)
+    # Return updated classroom JSON plus the next capture interval
+    return image_response("classroom image updated", updated, updated_dict)
 
-    # Encode annotated image to bytes
-    _, encoded = cv2.imencode(".jpg", img)
-    annotated_bytes = encoded.tobytes()
 
-    # Upload annotated image to Cloudinary
-    upload_result = cloudinary.uploader.upload(annotated_bytes, folder="smart_classrooms")
-    new_url = upload_result["secure_url"]
+@inference_router.post("/classrooms/{classId}/image", response_model=schemas.ResponseModel)
+async def upload_image(classId: str, deviceId: str = Form(...), file: UploadFile = File(...)):
+    classroom = await database.get_classroom_by_classId(classId)
+    if not classroom:
+        raise HTTPException(404, "classroom not found")
 
-    # Delete old image if exists
-    if classroom.latestImage:
-        public_id = "/".join(classroom.latestImage.split("/")[-2:]).split(".")[0]
-        try:
-            cloudinary.uploader.destroy(public_id)
-        except:
-            pass
+    if classroom.deviceId != deviceId:
+        raise HTTPException(400, "deviceId mismatch")
 
-    # Update DB
-    await database.update_classroom_by_classId(classId, {"occupancy": new_occupancy, "latestImage": new_url})
-    updated = await database.get_classroom_by_classId(classId)
+    contents = await file.read()
+    return await process_classroom_image(classId, classroom, contents)
 
-    # prepare payload: ensure _id is a string and datetimes are serializable
-    updated_dict = updated.model_dump()
-    if "_id" in updated_dict:
-        try:
-            updated_dict["_id"] = str(updated_dict["_id"])
-        except Exception:
-            updated_dict["_id"] = updated_dict["_id"]
-    # convert datetimes if present
-    for dt_key in ("createdAt", "updatedAt"):
-        if dt_key in updated_dict and updated_dict[dt_key] is not None:
-            try:
-                updated_dict[dt_key] = updated_dict[dt_key].isoformat()
-            except Exception:
-                pass
 
-    logger.info("Broadcast payload prepared for classroom_image_update: %s", updated_dict)
+# Raw-body variant for constrained devices: the JPEG is the whole request body and
+# the device id travels in the X-Device-Id header, so there is no multipart parsing
+# and no spooled temp file on the server.
+@inference_router.post("/classrooms/{classId}/image/raw", response_model=schemas.ResponseModel)
+async def upload_image_raw(classId: str, request: Request, x_device_id: str = Header(...)):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type != "image/jpeg":
+        raise HTTPException(415, "expected an image/jpeg request body")
 
-    # Broadcast via WebSocket.
-    await manager.broadcast(serialize({
-        "event": "classroom_image_update",
-        "classroom": updated_dict
-    }))
-
-    # Return updated classroom JSON only
-    return schemas.ResponseModel(
-        success=True,
-        message="classroom image updated",
-        data={"classroom": updated.model_dump()}
-    ).model_dump()
+    classroom = await database.get_classroom_by_classId(classId)
+    if not classroom:
+        raise HTTPException(404, "classroom not found")
+
+    if classroom.deviceId != x_device_id:
+        raise HTTPException(400, "deviceId mismatch")
+
+    contents = await read_body_capped(request, env.MAX_IMAGE_BYTES)
+    if not contents:
+        raise HTTPException(400, "empty image")
+
+    return await process_classroom_image(classId, classroom, contents)
+
+
+if env.APP_ROLE in ("api", "all"):
+    app.include_router(api_router)
+if env.APP_ROLE == "api":
+    app.include_router(internal_router)
+if env.APP_ROLE in ("inference", "all"):
+    app.include_router(inference_router)
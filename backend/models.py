@@ -1,9 +1,42 @@
-from pydantic import BaseModel, Field, model_validator
-from typing import Optional
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import List, Optional
 from datetime import datetime
 from bson import ObjectId
 
 
+class CaptureWindow(BaseModel):
+    start: str                              # "HH:MM", local time
+    end: str                                # "HH:MM", exclusive; before start = crosses midnight
+    intervalS: int
+    days: Optional[List[int]] = None        # 0 = Monday (day the window starts); None = every day
+
+    @field_validator("start", "end")
+    def hhmm(cls, v):
+        # normalised to zero-padded "HH:MM" so windows compare correctly as text
+        try:
+            return datetime.strptime(v.strip(), "%H:%M").strftime("%H:%M")
+        except ValueError:
+            raise ValueError("capture window times must be HH:MM (00:00 - 23:59)")
+
+    @field_validator("intervalS")
+    def interval_positive(cls, v):
+        if v <= 0:
+            raise ValueError("intervalS must be > 0")
+        return v
+
+    @field_validator("days")
+    def days_are_weekdays(cls, v):
+        if v is not None and any(d not in range(7) for d in v):
+            raise ValueError("days must be weekday numbers 0 (Monday) - 6 (Sunday)")
+        return v
+
+    @model_validator(mode="after")
+    def not_empty(self):
+        if self.start == self.end:
+            raise ValueError("capture window start and end must differ")
+        return self
+
+
 class Classroom(BaseModel):
     id: Optional[str] = Field(default=None, alias="_id")
     classId: str
@@ -12,6 +45,11 @@ class Classroom(BaseModel):
     deviceId: str
     capacity: int
     occupancy: int = 0
+    version: int = 0                        # bumped on every update; feeds the ETags
+    inferenceMode: str = "full"             # "full" (1920 px + TTA) or "tiled"
+    captureMinS: int = 15                   # bounds for the recommended capture interval
+    captureMaxS: int = 600
+    captureSchedule: Optional[List[CaptureWindow]] = None
 
     created_at: datetime = datetime.now()
     updated_at: datetime = datetime.now()
@@ -0,0 +1,179 @@
+"""
+Offline re-count of archived classroom frames.
+
+Runs a directory (or manifest) of JPEGs through the same decode + detection +
+person-count code as the upload endpoints, spread over a process pool with
+batched inference, and writes one row per frame with per-stage timings.
+Doubles as a throughput benchmark for the inference path.
+
+Usage:
+  python recount.py frames/ -o counts.csv
+  python recount.py manifest.txt -o counts.parquet --labels labels.csv --workers 8 --batch-size 8
+
+A manifest is a text file with one image path per line. Labels are a CSV with
+`file` and `count` columns (`file` matched against the frame's file name).
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, List
+
+import inference
+
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+FIELDS = ["file", "count", "read_ms", "decode_ms", "infer_ms", "total_ms", "error"]
+
+
+def collect_frames(source: str) -> List[str]:
+    path = Path(source)
+    if path.is_dir():
+        return sorted(str(p) for p in path.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+
+    base = path.parent
+    frames = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                frames.append(str(base / line) if not os.path.isabs(line) else line)
+    return frames
+
+
+def load_labels(path: str) -> Dict[str, int]:
+    with open(path, newline="") as f:
+        return {Path(row["file"]).name: int(row["count"]) for row in csv.DictReader(f)}
+
+
+_mode = "full"
+
+
+def _init_worker(threads: int, mode: str, backend: str, weights: str):
+    global _mode
+    _mode = mode
+    inference.use_backend(backend, weights)
+    # One model per process; keep torch from oversubscribing the cores the pool already uses
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    inference.get_model()
+
+
+def _process_batch(paths: List[str]) -> List[dict]:
+    rows, imgs = [], []
+    for p in paths:
+        row = {"file": p, "count": None, "error": ""}
+        t0 = time.perf_counter()
+        try:
+            with open(p, "rb") as f:
+                contents = f.read()
+        except OSError as e:
+            row["error"] = str(e)
+            rows.append(row)
+            continue
+        t1 = time.perf_counter()
+        img = inference.decode_image(contents)
+        t2 = time.perf_counter()
+        row["read_ms"] = (t1 - t0) * 1000
+        row["decode_ms"] = (t2 - t1) * 1000
+        if img is None:
+            row["error"] = "invalid image"
+        else:
+            imgs.append((row, img))
+        rows.append(row)
+
+    t0 = time.perf_counter()
+    if _mode == "tiled":
+        # each frame is already a batch of tiles
+        counts = [inference.count_people_tiled(img) for _, img in imgs]
+    else:
+        counts = inference.count_people_batch([img for _, img in imgs])
+    infer_ms = (time.perf_counter() - t0) * 1000 / max(len(imgs), 1)
+
+    for (row, _), count in zip(imgs, counts):
+        row["count"] = count
+        row["infer_ms"] = infer_ms
+    for row in rows:
+        row["total_ms"] = sum(row.get(k) or 0 for k in ("read_ms", "decode_ms", "infer_ms"))
+    return rows
+
+
+def write_rows(rows: List[dict], output: str, fields: List[str]):
+    if output.endswith(".parquet"):
+        try:
+            import pandas as pd
+        except ImportError:
+            sys.exit("Parquet output needs pandas and pyarrow installed; use a .csv output instead.")
+        pd.DataFrame(rows, columns=fields).to_parquet(output, index=False)
+        return
+
+    with open(output, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-count people in archived classroom frames.")
+    parser.add_argument("source", help="directory of images or a manifest file")
+    parser.add_argument("-o", "--output", default="recount.csv", help=".csv or .parquet")
+    parser.add_argument("--labels", help="ground-truth CSV with file,count columns")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--mode", choices=("full", "tiled"), default="full",
+                        help="inference mode, as configured per classroom")
+    # Same variables as the server (env.py), read directly so no server settings are needed
+    parser.add_argument("--backend", default=os.getenv("INFERENCE_BACKEND", "pytorch"),
+                        help="detection runtime: pytorch, onnx or openvino")
+    parser.add_argument("--weights", default=os.getenv("INFERENCE_WEIGHTS") or None,
+                        help="weights for the backend (defaults to its standard export)")
+    args = parser.parse_args(argv)
+
+    frames = collect_frames(args.source)
+    if not frames:
+        sys.exit(f"No images found in {args.source}")
+
+    batches = [frames[i:i + args.batch_size] for i in range(0, len(frames), args.batch_size)]
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+
+    started = time.perf_counter()
+    rows = []
+    with Pool(args.workers, initializer=_init_worker, initargs=(threads, args.mode, args.backend, args.weights)) as pool:
+        for batch_rows in pool.imap_unordered(_process_batch, batches):
+            rows.extend(batch_rows)
+    elapsed = time.perf_counter() - started
+
+    fields = list(FIELDS)
+    if args.labels:
+        labels = load_labels(args.labels)
+        fields += ["expected", "abs_error"]
+        for row in rows:
+            expected = labels.get(Path(row["file"]).name)
+            row["expected"] = expected
+            if expected is not None and row["count"] is not None:
+                row["abs_error"] = abs(row["count"] - expected)
+
+    rows.sort(key=lambda r: r["file"])
+    write_rows(rows, args.output, fields)
+
+    ok = [r for r in rows if r["count"] is not None]
+    print(f"{len(ok)}/{len(rows)} frames in {elapsed:.1f}s "
+          f"({len(rows) / elapsed:.2f} frames/s, {args.mode} mode on {args.backend}, {args.workers} workers x batch {args.batch_size})")
+    if ok:
+        for stage in ("read_ms", "decode_ms", "infer_ms"):
+            print(f"  mean {stage}: {sum(r[stage] for r in ok) / len(ok):.1f}")
+    scored = [r["abs_error"] for r in rows if r.get("abs_error") is not None]
+    if scored:
+        print(f"  MAE vs labels: {sum(scored) / len(scored):.2f} over {len(scored)} frames "
+              f"({sum(1 for e in scored if e == 0)} exact)")
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Interchangeable CPU inference runtimes for the person detector.
+
+Every backend exposes the same `predict(imgs, **kwargs)` call returning
+ultralytics `Results`, so the counting code in `inference` does not care
+which one is loaded:
+
+  pytorch  - yolov8n.pt through ultralytics/PyTorch (the original path)
+  onnx     - an exported .onnx model run by ONNX Runtime
+  openvino - an exported OpenVINO IR directory
+
+Exported models are built with dynamic shapes, so batching and per-call
+`imgsz` keep working; test-time augmentation is PyTorch-only and is turned
+off for the others. Optional INT8 weights are produced with a calibration
+pass over a directory of real classroom frames.
+
+Usage:
+  python runtimes.py export onnx [--int8 --calib frames/] [--imgsz 640]
+  python runtimes.py export openvino [--int8 --calib frames/]
+  python runtimes.py bench frames/ --backends pytorch onnx openvino [--weights onnx=yolov8n_int8.onnx]
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+SOURCE_WEIGHTS = "yolov8n.pt"
+
+
+class InferenceBackend:
+    name = "pytorch"
+    default_weights = SOURCE_WEIGHTS
+    weight_suffixes = (".pt",)
+    supports_augment = True
+
+    def __init__(self, weights: Optional[str] = None):
+        from ultralytics import YOLO
+
+        self.weights = weights or self.default_weights
+        self.model = YOLO(self.weights, task="detect")
+
+    def predict(self, imgs, **kwargs):
+        if not self.supports_augment:
+            kwargs["augment"] = False
+        return self.model.predict(imgs, **kwargs)
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    name = "onnx"
+    default_weights = "yolov8n.onnx"
+    weight_suffixes = (".onnx",)
+    supports_augment = False
+
+
+class OpenVINOBackend(InferenceBackend):
+    name = "openvino"
+    default_weights = "yolov8n_openvino_model/"
+    weight_suffixes = ("_openvino_model", ".xml")
+    supports_augment = False
+
+
+BACKENDS = {cls.name: cls for cls in (InferenceBackend, OnnxRuntimeBackend, OpenVINOBackend)}
+
+
+def check_backend(name: str, weights: Optional[str] = None):
+    """Raise ValueError for an unknown backend or weights built for another runtime."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}', expected one of: {', '.join(BACKENDS)}")
+    backend = BACKENDS[name]
+    # ultralytics picks the runtime from the weights, so a mismatch would silently run another backend
+    if weights and not weights.rstrip("/\\").lower().endswith(backend.weight_suffixes):
+        raise ValueError(f"Weights '{weights}' do not match backend '{name}' (expected {' or '.join(backend.weight_suffixes)})")
+
+
+def load_backend(name: str, weights: Optional[str] = None) -> InferenceBackend:
+    check_backend(name, weights)
+    return BACKENDS[name](weights)
+
+
+# -------------------------------------------------------
+# EXPORT / INT8 CALIBRATION
+# -------------------------------------------------------
+def _calibration_frames(calib_dir: str, limit: int = 200) -> List[str]:
+    frames = sorted(str(p) for p in Path(calib_dir).rglob("*") if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    if not frames:
+        raise ValueError(f"No calibration images found in {calib_dir}")
+    return frames[:limit]
+
+
+def _letterbox_tensor(path: str, imgsz: int):
+    """Preprocess a frame exactly like ultralytics: letterbox, BGR->RGB, 0-1, NCHW."""
+    import cv2
+    import numpy as np
+
+    img = cv2.imread(path)
+    h, w = img.shape[:2]
+    scale = min(imgsz / h, imgsz / w)
+    nh, nw = round(h * scale), round(w * scale)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - nh) // 2, (imgsz - nw) // 2
+    canvas[top:top + nh, left:left + nw] = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    return canvas[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+
+
+def _quantize_onnx(fp32_path: str, calib_dir: str, imgsz: int) -> str:
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    frames = _calibration_frames(calib_dir)
+    model = onnx.load(fp32_path)
+    input_name = model.graph.input[0].name
+    # The Detect head (last module) decodes boxes; keep it in float to preserve localisation
+    # (exported node names look like "/model.22/cv2.0/...")
+    last_module = max(int(n.name.split("/")[1].split(".")[1]) for n in model.graph.node if n.name.startswith("/model."))
+    head_nodes = [n.name for n in model.graph.node if n.name.startswith(f"/model.{last_module}/")]
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self.frames = iter(frames)
+
+        def get_next(self):
+            path = next(self.frames, None)
+            return None if path is None else {input_name: _letterbox_tensor(path, imgsz)}
+
+    int8_path = fp32_path.replace(".onnx", "_int8.onnx")
+    quantize_static(
+        fp32_path, int8_path, FrameReader(),
+        quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+        nodes_to_exclude=head_nodes,
+    )
+    return int8_path
+
+
+def export(name: str, imgsz: int = 640, int8: bool = False, calib_dir: Optional[str] = None) -> str:
+    """Export yolov8n.pt for backend `name`; returns the path to load with that backend."""
+    from ultralytics import YOLO
+
+    if int8 and not calib_dir:
+        raise ValueError("INT8 export needs --calib <directory of representative frames>")
+
+    model = YOLO(SOURCE_WEIGHTS)
+    if name == "onnx":
+        path = model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+        return _quantize_onnx(path, calib_dir, imgsz) if int8 else path
+
+    if name == "openvino":
+        if not int8:
+            return model.export(format="openvino", imgsz=imgsz, dynamic=True)
+        # ultralytics calibrates OpenVINO INT8 (via NNCF) from a dataset yaml; labels are not needed
+        with tempfile.TemporaryDirectory() as tmp:
+            data = Path(tmp) / "calib.yaml"
+            data.write_text(f"path: {Path(calib_dir).resolve()}\ntrain: .\nval: .\nnames:\n  0: person\n")
+            return model.export(format="openvino", imgsz=imgsz, dynamic=True, int8=True, data=str(data))
+
+    raise ValueError(f"Nothing to export for backend '{name}'")
+
+
+# -------------------------------------------------------
+# PARITY + LATENCY BENCHMARK
+# -------------------------------------------------------
+def bench(frames: List[str], backends: List[str], weights: Dict[str, str],
+          imgsz: Optional[int] = None, tolerance: int = 1) -> bool:
+    """
+    Time each backend per frame and compare its person counts to the first
+    backend's, using the full-quality serving settings (inference.QUALITY_LEVELS[0])
+    unless `imgsz` overrides the input size. TTA is off for every backend,
+    since only PyTorch supports it and the comparison is between runtimes.
+    """
+    import cv2
+    import inference
+
+    imgs = [cv2.imread(f) for f in frames]
+    args = dict(inference.QUALITY_LEVELS[0], augment=False, classes=[inference.PERSON_CLASS], verbose=False)
+    if imgsz:
+        args["imgsz"] = imgsz
+
+    counts: Dict[str, List[int]] = {}
+    for name in backends:
+        backend = load_backend(name, weights.get(name))
+        backend.predict(imgs[0], **args)  # warm-up
+        latencies = []
+        counts[name] = []
+        for img in imgs:
+            t0 = time.perf_counter()
+            result = backend.predict(img, **args)[0]
+            latencies.append((time.perf_counter() - t0) * 1000)
+            counts[name].append(len(result.boxes))
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"{name:>9} ({backend.weights}): p50 {p50:.1f} ms, p95 {p95:.1f} ms, "
+              f"mean {sum(latencies) / len(latencies):.1f} ms/frame")
+
+    reference = backends[0]
+    ok = True
+    for name in backends[1:]:
+        diffs = [abs(a - b) for a, b in zip(counts[reference], counts[name])]
+        within = sum(1 for d in diffs if d <= tolerance)
+        print(f"{name} vs {reference}: max |count diff| {max(diffs)}, "
+              f"{within}/{len(diffs)} frames within +/-{tolerance}")
+        ok = ok and within == len(diffs)
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export and compare person-detector runtimes.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="export yolov8n.pt for a backend")
+    p_export.add_argument("backend", choices=("onnx", "openvino"))
+    p_export.add_argument("--imgsz", type=int, default=640)
+    p_export.add_argument("--int8", action="store_true", help="quantize to INT8 (needs --calib)")
+    p_export.add_argument("--calib", help="directory of representative frames for INT8 calibration")
+
+    p_bench = sub.add_parser("bench", help="per-frame latency and count parity across backends")
+    p_bench.add_argument("frames", help="directory of images")
+    p_bench.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    p_bench.add_argument("--weights", nargs="*", default=[], help="backend=path overrides")
+    p_bench.add_argument("--imgsz", type=int, default=None, help="override the serving input size")
+    p_bench.add_argument("--tolerance", type=int, default=1, help="allowed |count diff| per frame")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        print(export(args.backend, imgsz=args.imgsz, int8=args.int8, calib_dir=args.calib))
+        return
+
+    frames = _calibration_frames(args.frames, limit=sys.maxsize)
+    weights = dict(w.split("=", 1) for w in args.weights)
+    if not bench(frames, args.backends, weights, args.imgsz, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,19 @@
-from pydantic import BaseModel, Field, field_validator
-from typing import Union
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import List, Union
 from enum import Enum
 
+from models import CaptureWindow
+
+
+INFERENCE_MODES = ("full", "tiled")
+# Longest capture interval a device will honour (firmware maxInterval)
+MAX_CAPTURE_S = 3600
+
+
+def check_capture_bounds(lo: int, hi: int):
+    if not 0 < lo <= hi <= MAX_CAPTURE_S:
+        raise ValueError(f"capture bounds must satisfy 0 < captureMinS <= captureMaxS <= {MAX_CAPTURE_S}")
+
 
 class CreateClassroomRequest(BaseModel):
     classId: str
@@ -10,6 +22,21 @@ class CreateClassroomRequest(BaseModel):
     capacity: int
     occupancy: int = 0
     latestImage: Union[str, None] = None
+    inferenceMode: str = "full"
+    captureMinS: int = 15
+    captureMaxS: int = 600
+    captureSchedule: Union[List[CaptureWindow], None] = None
+
+    @field_validator("inferenceMode")
+    def inference_mode_known(cls, v):
+        if v not in INFERENCE_MODES:
+            raise ValueError(f"inferenceMode must be one of {INFERENCE_MODES}")
+        return v
+
+    @model_validator(mode="after")
+    def capture_bounds_ordered(self):
+        check_capture_bounds(self.captureMinS, self.captureMaxS)
+        return self
 
     model_config = {
         "json_schema_extra": {
@@ -31,6 +58,10 @@ class UpdateClassroomRequest(BaseModel):
     occupancy: Union[int, None]
     latestImage: Union[str, None]
     classId: Union[str, None] 
+    inferenceMode: Union[str, None] = None
+    captureMinS: Union[int, None] = None
+    captureMaxS: Union[int, None] = None
+    captureSchedule: Union[List[CaptureWindow], None] = None
 
     @field_validator("capacity")
     def capacity_non_negative(cls, v):
@@ -44,6 +75,25 @@ class UpdateClassroomRequest(BaseModel):
             raise ValueError("occupancy must be >= 0")
         return v
 
+    @field_validator("captureMinS", "captureMaxS")
+    def capture_bound_in_range(cls, v):
+        if v is not None and not 0 < v <= MAX_CAPTURE_S:
+            raise ValueError(f"capture bounds must be between 1 and {MAX_CAPTURE_S}")
+        return v
+
+    @model_validator(mode="after")
+    def capture_bounds_ordered(self):
+        # only when both are sent; the route checks a single bound against the stored one
+        if self.captureMinS is not None and self.captureMaxS is not None:
+            check_capture_bounds(self.captureMinS, self.captureMaxS)
+        return self
+
+    @field_validator("inferenceMode")
+    def inference_mode_known(cls, v):
+        if v is not None and v not in INFERENCE_MODES:
+            raise ValueError(f"inferenceMode must be one of {INFERENCE_MODES}")
+        return v
+
 
 class ResponseModel(BaseModel):
     success: bool
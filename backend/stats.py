@@ -0,0 +1,67 @@
+"""
+Campus-wide occupancy aggregates, maintained incrementally in memory.
+
+Every write path (create / update / delete / image upload) reports the new
+state of one room; the totals are adjusted by the difference from that
+room's previous contribution, so serving the summary is O(1) regardless of
+how many classrooms exist. The aggregates are per process; they are seeded
+from the database at startup and re-seeded periodically, so writes made by
+other processes are picked up within STATS_RESEED_S.
+"""
+from typing import Dict, Iterable, Tuple
+
+
+class OccupancyStats:
+    def __init__(self):
+        self._reset()
+        self.loaded = False
+
+    def _reset(self):
+        # classId -> (occupancy, capacity)
+        self.rooms: Dict[str, Tuple[int, int]] = {}
+        self.total_occupancy = 0
+        self.total_capacity = 0
+        self.occupied_rooms = 0
+        self.over_capacity_rooms = 0
+
+    def _apply(self, occupancy: int, capacity: int, sign: int):
+        self.total_occupancy += sign * occupancy
+        self.total_capacity += sign * capacity
+        if occupancy > 0:
+            self.occupied_rooms += sign
+        if occupancy > capacity:
+            self.over_capacity_rooms += sign
+
+    def load(self, rooms: Iterable[Tuple[str, int, int]]):
+        """Replace the aggregates with (classId, occupancy, capacity) for every room."""
+        self._reset()
+        for classId, occupancy, capacity in rooms:
+            self.upsert(classId, occupancy, capacity)
+        self.loaded = True
+
+    def upsert(self, classId: str, occupancy: int, capacity: int, previous_classId: str = None):
+        """Record the current state of a room (optionally renamed from `previous_classId`)."""
+        if previous_classId and previous_classId != classId:
+            self.remove(previous_classId)
+
+        old = self.rooms.get(classId)
+        if old is not None:
+            self._apply(*old, sign=-1)
+
+        new = (occupancy or 0, capacity or 0)
+        self.rooms[classId] = new
+        self._apply(*new, sign=1)
+
+    def remove(self, classId: str):
+        old = self.rooms.pop(classId, None)
+        if old is not None:
+            self._apply(*old, sign=-1)
+
+    def snapshot(self) -> dict:
+        return {
+            "totalRooms": len(self.rooms),
+            "occupiedRooms": self.occupied_rooms,
+            "overCapacityRooms": self.over_capacity_rooms,
+            "totalOccupancy": self.total_occupancy,
+            "totalCapacity": self.total_capacity,
+        }
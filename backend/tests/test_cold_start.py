@@ -0,0 +1,40 @@
+"""
+An APP_ROLE=api process must start without the inference stack: importing
+main may not pull in torch, ultralytics, cv2, numpy or cloudinary.
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+for dep in ("fastapi", "motor", "dotenv", "httpx", "orjson"):
+    pytest.importorskip(dep)
+
+BACKEND = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ("torch", "ultralytics", "cv2", "numpy", "cloudinary")
+IMPORT_BUDGET_S = 1.0  # "starts in well under a second"
+
+CHECK = (
+    "import sys, time\n"
+    "t = time.perf_counter()\n"
+    "import main\n"
+    "print(time.perf_counter() - t)\n"
+    f"print('loaded=' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+)
+
+
+def test_api_role_does_not_import_inference_stack():
+    env_vars = dict(
+        os.environ, APP_ROLE="api", DATABASE_URL="mongodb://localhost:27017", INTERNAL_TOKEN="test-token"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", CHECK], cwd=BACKEND, env=env_vars,
+        capture_output=True, text=True, timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+
+    elapsed, loaded = result.stdout.strip().splitlines()[-2:]
+    assert loaded == "loaded=", f"api role imported: {loaded[len('loaded='):]}"
+    assert float(elapsed) < IMPORT_BUDGET_S
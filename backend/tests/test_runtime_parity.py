@@ -0,0 +1,35 @@
+"""
+Person counts from the exported runtimes must match PyTorch on real frames.
+
+Needs a directory of classroom frames in PARITY_FRAMES plus the optional
+runtimes and their exported weights (`python runtimes.py export ...`);
+whatever is missing is skipped.
+"""
+import os
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("ultralytics")
+
+import runtimes
+
+BACKEND = Path(__file__).resolve().parent.parent
+FRAMES_DIR = os.getenv("PARITY_FRAMES")
+MAX_FRAMES = 20
+TOLERANCE = 1  # persons per frame
+
+
+@pytest.mark.parametrize("name, module", [("onnx", "onnxruntime"), ("openvino", "openvino")])
+def test_runtime_counts_match_pytorch(name, module, monkeypatch):
+    pytest.importorskip(module)
+    if not FRAMES_DIR:
+        pytest.skip("set PARITY_FRAMES to a directory of classroom frames")
+    weights = BACKEND / runtimes.BACKENDS[name].default_weights
+    if not weights.exists():
+        pytest.skip(f"{weights.name} not exported (python runtimes.py export {name})")
+
+    monkeypatch.chdir(BACKEND)
+    frames = runtimes._calibration_frames(FRAMES_DIR, limit=MAX_FRAMES)
+    assert runtimes.bench(frames, ["pytorch", name], {}, tolerance=TOLERANCE)
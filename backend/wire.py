@@ -0,0 +1,31 @@
+"""
+Single JSON encoding path for HTTP responses and WebSocket broadcasts.
+
+Route handlers build plain dicts from trusted data (documents that already
+went through `models.Classroom`) and hand them to `respond()`, which encodes
+them with orjson directly instead of re-validating against
+`schemas.ResponseModel` and running FastAPI's `jsonable_encoder`. Broadcasts
+are encoded once with `dumps()` and the same text is sent to every client.
+"""
+from typing import Any
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+import models
+
+
+def classroom_to_wire(classroom: models.Classroom) -> dict:
+    """Convert a classroom to its wire dict once; datetimes are left for orjson."""
+    return classroom.model_dump()
+
+
+def respond(message: str, data: Any = None, success: bool = True, status_code: int = 200) -> ORJSONResponse:
+    return ORJSONResponse(
+        {"success": success, "message": message, "data": data},
+        status_code=status_code,
+    )
+
+
+def dumps(obj: Any) -> str:
+    return orjson.dumps(obj).decode()
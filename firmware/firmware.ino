@@ -38,7 +38,12 @@ WiFiClient client;
 #define HREF_GPIO_NUM     23
 #define PCLK_GPIO_NUM     22
 
-const int timerInterval = 30000;    // time between each HTTP POST image (30 secs)
+// Time between each HTTP POST image. Starts at 30 secs and is replaced by the
+// server's recommendation (data.nextCaptureS) after every upload.
+const unsigned long defaultInterval = 30000;
+const unsigned long minInterval = 5000;       // never capture more often than this
+const unsigned long maxInterval = 3600000;    // ... or less often than this
+unsigned long timerInterval = defaultInterval;
 unsigned long previousMillis = 0;   // last time image was sent
 
 void setup() {
@@ -127,29 +132,17 @@ String sendPhoto() {
   if (client.connect(serverName.c_str(), serverPort)) {
     Serial.println("Connection successful!");    
     
-    // Create multipart form data with deviceId and file
-    String boundary = "----WebKitFormBoundary7MA4YWxkTrZu0gW";
-    
-    String head = "--" + boundary + "\r\n";
-    head += "Content-Disposition: form-data; name=\"deviceId\"\r\n\r\n";
-    head += deviceId + "\r\n";
-    head += "--" + boundary + "\r\n";
-    head += "Content-Disposition: form-data; name=\"file\"; filename=\"esp32-cam.jpg\"\r\n";
-    head += "Content-Type: image/jpeg\r\n\r\n";
-    
-    String tail = "\r\n--" + boundary + "--\r\n";
-
+    // Send the JPEG as the raw request body (serverPath must point at
+    // /classrooms/<classId>/image/raw); the device id goes in a header
     uint32_t imageLen = fb->len;
-    uint32_t extraLen = head.length() + tail.length();
-    uint32_t totalLen = imageLen + extraLen;
   
     client.println("POST " + serverPath + " HTTP/1.1");
     client.println("Host: " + serverName);
-    client.println("Content-Length: " + String(totalLen));
-    client.println("Content-Type: multipart/form-data; boundary=" + boundary);
+    client.println("Content-Length: " + String(imageLen));
+    client.println("Content-Type: image/jpeg");
+    client.println("X-Device-Id: " + deviceId);
     client.println("accept: application/json");
     client.println();
-    client.print(head);
   
     uint8_t *fbBuf = fb->buf;
     size_t fbLen = fb->len;
@@ -163,7 +156,6 @@ String sendPhoto() {
         client.write(fbBuf, remainder);
       }
     }   
-    client.print(tail);
     
     esp_camera_fb_return(fb);
     
@@ -219,11 +211,19 @@ void parseAndPrintDetails(String json) {
     String classId = doc["data"]["classroom"]["classId"].as<String>();
     int occupancy = doc["data"]["classroom"]["occupancy"];
     int capacity = doc["data"]["classroom"]["capacity"];
+
+    // Honour the server's recommended capture interval
+    unsigned long nextCaptureS = doc["data"]["nextCaptureS"] | 0UL;
+    if (nextCaptureS > 0) {
+      // clamp in seconds first: nextCaptureS * 1000 overflows 32 bits past ~49 days
+      timerInterval = constrain(nextCaptureS, minInterval / 1000UL, maxInterval / 1000UL) * 1000UL;
+    }
     
     Serial.println("\n=== IMPORTANT DETAILS ===");
     Serial.println("Class ID: " + classId);
     Serial.println("Occupancy: " + String(occupancy));
     Serial.println("Capacity: " + String(capacity));
+    Serial.println("Next capture in: " + String(timerInterval / 1000) + " s");
     Serial.println("=========================\n");
   } else {
     Serial.println("Unable to extract classroom details from response");